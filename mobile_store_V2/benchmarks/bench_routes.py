@@ -0,0 +1,283 @@
+"""Benchmark the mobile store routes and storage layer at realistic data sizes.
+
+Generates synthetic data files in a temporary directory for every size,
+drives the key routes through Flask's test client and times the storage
+layer directly. Every size runs in its own process so peak memory and
+caches are measured in isolation.
+
+    python benchmarks/bench_routes.py --sizes 1000,10000,100000 --output bench.json
+    python benchmarks/bench_routes.py --sizes 1000 --compare bench.json
+
+Results are saved as JSON; --compare prints the change against an earlier
+run so regressions between versions stand out.
+"""
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BRANDS = ["Samsung", "iPhone", "Xiaomi", "Huawei", "Oppo", "Realme", "Nokia"]
+CUSTOMERS = ["Ahmed", "Mona", "Omar", "Sara", "Youssef", "Nour"]
+
+
+def _row(rng, index, serial):
+    brand = rng.choice(BRANDS)
+    bought = rng.randrange(1000, 30000, 50)
+    return {
+        "Brand": brand,
+        "Serial": serial,
+        "Model": f"{brand[:1]}{index % 400}",
+        "Box": rng.choice(["Yes", "No"]),
+        "Charger": rng.choice(["Yes", "No"]),
+        "Bought Price": str(bought),
+        "Sell Price": str(bought + rng.randrange(0, 3000, 50)),
+        "Category": "available",
+        "Notes": rng.choice(["", "", "scratch on back", "new", "used"]),
+        "Quantity": "1",
+    }
+
+
+def generate(data_dir, size, seed=1):
+    """Write synthetic inventory/phones/sold/services/finished files with ``size`` rows."""
+    sys.path.insert(0, APP_DIR)
+    from storage import FIELDNAMES, INDIVIDUAL_FIELDNAMES
+
+    rng = random.Random(seed)
+
+    def write(name, fieldnames, rows):
+        with open(os.path.join(data_dir, name), "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction="ignore", restval="")
+            writer.writeheader()
+            writer.writerows(rows)
+
+    # Grouped rows keep the placeholder serial like add() does; the first
+    # group holds enough units for every benchmark sale
+    def inventory_rows():
+        for i in range(size):
+            row = _row(rng, i, "0")
+            row["Model"] = f"G{i}"
+            row["Quantity"] = "1000000" if i == 0 else str(rng.randrange(1, 20))
+            yield row
+
+    def sold_rows():
+        for i in range(size):
+            row = _row(rng, i, f"SOLD{i:09d}")
+            row.update({"Customer Name": rng.choice(CUSTOMERS), "Customer Number": "0100",
+                        "Sale Date": f"2025-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d}",
+                        "Sale Time": "12:00:00"})
+            yield row
+
+    def service_rows(prefix, count):
+        for i in range(count):
+            row = _row(rng, i, f"{prefix}{i:09d}")
+            row.update({"Category": "service", "Customer Name": rng.choice(CUSTOMERS),
+                        "Service Price": str(rng.randrange(100, 1000, 10))})
+            yield row
+
+    write("inventory.csv", FIELDNAMES, inventory_rows())
+    write("phones.csv", INDIVIDUAL_FIELDNAMES, (_row(rng, i, f"PH{i:012d}") for i in range(size)))
+    write("sold_phones.csv", FIELDNAMES, sold_rows())
+    write("services.csv", FIELDNAMES, service_rows("SV", size))
+    write("finished.csv", FIELDNAMES, service_rows("FN", max(size // 10, 1)))
+    with open(os.path.join(data_dir, "total_sales.csv"), "w", encoding="utf-8") as f:
+        f.write("Total Sales\n0")
+
+
+def _percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+def _summary(samples, cold):
+    total = sum(samples)
+    return {
+        "count": len(samples),
+        "cold_ms": round(cold * 1000, 3),
+        "mean_ms": round(total / len(samples) * 1000, 3),
+        "p50_ms": round(_percentile(samples, 0.50) * 1000, 3),
+        "p90_ms": round(_percentile(samples, 0.90) * 1000, 3),
+        "p99_ms": round(_percentile(samples, 0.99) * 1000, 3),
+        "max_ms": round(max(samples) * 1000, 3),
+        "throughput_rps": round(len(samples) / total, 1) if total else None,
+    }
+
+
+def _time(call, iterations):
+    """Time one cold call and ``iterations`` warm calls."""
+    started = time.perf_counter()
+    call(0)
+    cold = time.perf_counter() - started
+    samples = []
+    for i in range(1, iterations + 1):
+        started = time.perf_counter()
+        call(i)
+        samples.append(time.perf_counter() - started)
+    return _summary(samples, cold)
+
+
+def _peak_rss_kb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_size(size, iterations, backend, write_behind=False):
+    """Benchmark one data size in the current process; return its results."""
+    data_dir = tempfile.mkdtemp(prefix=f"store-bench-{size}-")
+    started = time.perf_counter()
+    generate(data_dir, size)
+    generated = time.perf_counter() - started
+
+    os.chdir(data_dir)
+    os.environ["STORAGE_BACKEND"] = backend
+    os.environ["WRITE_BEHIND"] = "1" if write_behind else "0"
+    sys.path.insert(0, APP_DIR)
+    started = time.perf_counter()
+    import demoV11
+    app = demoV11.create_app(prewarm=False)
+    startup = time.perf_counter() - started
+    from storage import CsvStore, import_csv_files
+
+    # The ledger and serial registry are built from the data, so it must be
+    # in the database before prepare_data() runs
+    if backend == "sqlite":
+        import_csv_files(CsvStore(data_dir), demoV11.store, demoV11.DATA_FILES)
+    # What the first request pays: recovery checks and derived files
+    started = time.perf_counter()
+    demoV11.prepare_data()
+    prepared = time.perf_counter() - started
+
+    app.config["TESTING"] = True
+    client = app.test_client()
+
+    def check(response):
+        if response.status_code >= 400:
+            raise RuntimeError(f"{response.request.path} returned {response.status_code}")
+
+    first_group = demoV11.inventory_rows()[0]
+    service_serial = demoV11.services_rows()[size // 2]["Serial"]
+    # Moved between services and finished by every POST /edit
+    edited_serial = demoV11.services_rows()[(size // 2 + 1) % size]["Serial"]
+    group_form = {"brand": first_group["Brand"], "model": first_group["Model"], "box": first_group["Box"],
+                  "charger": first_group["Charger"], "sell_price": first_group["Sell Price"]}
+
+    routes = {
+        "GET /inventory": lambda i: check(client.get("/inventory")),
+        "GET /sells?search=": lambda i: check(client.get(f"/sells?search=g{i % 100}")),
+        "POST /add": lambda i: check(client.post("/add", data={
+            "brand": "Samsung", "model": "bench", "bought_price": "100", "sell_price": "150",
+            "category": "available", "serials": [f"BENCH{i:09d}"]})),
+        "POST /sell/<serial>": lambda i: check(client.post("/sell/0", data={
+            "customer_name": "Bench", "customer_number": "0100", "serials": [f"SALE{i:09d}"]})),
+        "POST /send_to_service": lambda i: check(client.post("/send_to_service", data=group_form)),
+        "GET /edit/<serial>": lambda i: check(client.get(f"/edit/{service_serial}")),
+        "POST /edit/<serial>": lambda i: check(client.post(f"/edit/{edited_serial}", data={
+            "category": "Finished" if i % 2 == 0 else "Service", "Notes": f"bench {i}"})),
+    }
+    results = {"rows": size, "generate_s": round(generated, 3), "startup_s": round(startup, 3),
+               "prepare_s": round(prepared, 3), "routes": {}, "storage": {}}
+    for name, call in routes.items():
+        results["routes"][name] = _time(call, iterations)
+
+    store = demoV11.store
+    phones_file, fields = demoV11.INDIVIDUAL_PHONES_FILE, demoV11.INDIVIDUAL_FIELDNAMES
+    storage_calls = {
+        "parse phones.csv (cold)": lambda i: (store.invalidate(phones_file), store.rows(phones_file, fields)),
+        "rows phones.csv (cached)": lambda i: store.rows(phones_file, fields),
+        "find by serial": lambda i: store.find(phones_file, {"Serial": f"PH{(i * 7919) % size:012d}"}, fields),
+        "find by group key": lambda i: store.find(demoV11.CSV_FILE, demoV11.group_match(*group_form.values())),
+        "append 1 row": lambda i: store.append(demoV11.SOLD_FILE, [{"Serial": f"APP{i}"}], demoV11.FIELDNAMES),
+        "update 1 row (rewrite)": lambda i: store.update(demoV11.SERVICES_FILE, {"Serial": service_serial},
+                                                         {"Notes": f"bench {i}"}),
+    }
+    for name, call in storage_calls.items():
+        results["storage"][name] = _time(call, max(iterations // 5, 3))
+
+    results["peak_rss_kb"] = _peak_rss_kb()
+    if write_behind:
+        # Write the pending changes while the data directory still exists
+        store.close()
+    os.chdir(APP_DIR)
+    shutil.rmtree(data_dir, ignore_errors=True)
+    return results
+
+
+def compare(old, new):
+    """Print p50 changes between two result files for the sizes they share."""
+    for size, result in new["results"].items():
+        before = old.get("results", {}).get(size)
+        if not before:
+            continue
+        print(f"\n{size} rows")
+        for section in ("routes", "storage"):
+            for name, stats in result[section].items():
+                previous = before.get(section, {}).get(name)
+                if not previous or not previous["p50_ms"]:
+                    continue
+                change = (stats["p50_ms"] - previous["p50_ms"]) / previous["p50_ms"] * 100
+                print(f"  {name:32} p50 {previous['p50_ms']:>10.3f} -> {stats['p50_ms']:>10.3f} ms ({change:+.0f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000",
+                        help="comma-separated row counts, e.g. 1000,10000,100000,1000000")
+    parser.add_argument("--iterations", type=int, default=30, help="warm requests per route")
+    parser.add_argument("--backend", choices=["csv", "sqlite"], default="csv")
+    parser.add_argument("--write-behind", action="store_true", help="run the app in write-behind mode")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="earlier JSON results to compare against")
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        json.dump(run_size(args.worker, args.iterations, args.backend, args.write_behind), sys.stdout)
+        return
+
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "backend": args.backend,
+        "write_behind": args.write_behind,
+        "iterations": args.iterations,
+        "results": {},
+    }
+    for size in (int(size) for size in args.sizes.split(",")):
+        print(f"Benchmarking {size} rows...", file=sys.stderr)
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--worker", str(size),
+             "--iterations", str(args.iterations), "--backend", args.backend]
+            + (["--write-behind"] if args.write_behind else []),
+            check=True, capture_output=True, text=True).stdout
+        result = json.loads(output)
+        report["results"][str(size)] = result
+        for section in ("routes", "storage"):
+            for name, stats in result[section].items():
+                print(f"  {name:32} p50 {stats['p50_ms']:>10.3f} ms  p99 {stats['p99_ms']:>10.3f} ms  "
+                      f"cold {stats['cold_ms']:>10.3f} ms  {stats['throughput_rps'] or 0:>8.1f}/s",
+                      file=sys.stderr)
+        print(f"  peak RSS {result['peak_rss_kb']} KB", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
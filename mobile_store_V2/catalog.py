@@ -0,0 +1,57 @@
+import hashlib
+import json
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+
+from storage import appended_rows
+
+
+class BrandCatalog:
+    """Brand -> sorted models of the inventory, kept up to date incrementally.
+
+    refresh() is cheap when the inventory rows did not change. Rows the
+    store only appended are counted on their own; any other change recounts
+    the Brand/Model pairs without re-reading the file. The catalog's ETag is
+    a hash of its contents, so it is the same in every worker, and
+    last_modified only moves when the brand/model set really changed.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rows = None
+        self._counts = Counter()
+        self._catalog = {}
+        self.etag = None
+        self.last_modified = None
+
+    @staticmethod
+    def _pair(row):
+        return (row.get("Brand", "Unknown"), row.get("Model", "Unknown"))
+
+    def refresh(self, rows):
+        with self._lock:
+            old = self._rows
+            if old is rows:
+                return
+            appended = appended_rows(old, rows)
+            if appended is not None:
+                self._counts.update(self._pair(row) for row in appended)
+            else:
+                self._counts = Counter(self._pair(row) for row in rows)
+            self._rows = rows
+
+            catalog = {}
+            for brand, model in self._counts:
+                catalog.setdefault(brand, set()).add(model)
+            catalog = {brand: sorted(models) for brand, models in catalog.items()}
+            if catalog != self._catalog or self.etag is None:
+                self._catalog = catalog
+                payload = json.dumps(catalog, sort_keys=True).encode("utf-8")
+                self.etag = hashlib.sha1(payload).hexdigest()
+                self.last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+
+    def brands_and_models(self):
+        """The current catalog; shared, do not modify."""
+        with self._lock:
+            return self._catalog
@@ -1,12 +1,71 @@
-from flask import Flask, render_template, request, redirect, url_for, flash
-import csv
+from flask import (Flask, Response, abort, render_template, request, redirect, url_for, flash,
+                   has_request_context, jsonify, stream_with_context)
+from werkzeug.local import LocalProxy
+import click
+import hashlib
+import logging
 import os
+import threading
+import time
+from contextvars import ContextVar
 from datetime import datetime
+from decimal import Decimal
+
+from catalog import BrandCatalog
+from export import csv_chunks, filter_rows, gzip_chunks
+from integrity import STATE_DIR as INTEGRITY_DIR, IntegrityChecker, StaleReport
+from intake import import_stock, parse_upload, units_per_second
+from ledger import SalesLedger
+from metrics import StoreMetrics
+from moves import MoveEngine
+from paging import memo, memo_quantity_total, page_of, read_options
+from records import InventoryGroup, Phone, ServiceJob, SoldUnit, typed
+from registry import SOLD, SerialRegistry
+from reports import DIMENSIONS, SalesReport, parse_day
+from search import SearchIndex
+from shops import ENVIRON_KEY as SHOP_ENVIRON_KEY, ROOT_KEY as SHOP_ROOT_KEY, ShopSelector, fan_out, parse_stores
+from storage import (CsvStore, DuplicateSerialError, FIELDNAMES, GROUP_KEY,
+                     INDIVIDUAL_FIELDNAMES, import_csv_files, open_store,
+                     write_text_atomic)
+from writebehind import JOURNAL_FILE as WRITE_BEHIND_JOURNAL, WriteBehindStore
 
 
 app = Flask(__name__)
 app.secret_key = "your_secret_key"  # Needed for flash messages
 
+# Storage backend: "csv" (default) or "sqlite"
+app.config["STORAGE_BACKEND"] = os.environ.get("STORAGE_BACKEND", "csv")
+app.config["SQLITE_DB"] = os.environ.get("SQLITE_DB", "store.db")
+
+# Shops served by this process as name=data directory, e.g.
+# STORES="main=.,north=/srv/north". A request picks its shop by URL prefix
+# (/north/inventory) or subdomain (north.example.com); requests naming none,
+# and the maintenance commands, use DEFAULT_STORE (the first one by default).
+# SQLITE_DB is relative to each shop's directory.
+app.config["STORES"] = parse_stores(os.environ.get("STORES", "main=."))
+app.config["DEFAULT_STORE"] = os.environ.get("DEFAULT_STORE") or next(iter(app.config["STORES"]))
+if app.config["DEFAULT_STORE"] not in app.config["STORES"]:
+    raise ValueError(f"DEFAULT_STORE {app.config['DEFAULT_STORE']!r} is not one of STORES")
+
+# Opt-in request timings and storage counters at /metrics; requests slower
+# than SLOW_REQUEST_MS are logged with their read/write/render breakdown
+app.config["STORE_METRICS"] = os.environ.get("STORE_METRICS") == "1"
+app.config["SLOW_REQUEST_MS"] = float(os.environ.get("SLOW_REQUEST_MS", "500"))
+
+# Opt-in write-behind (csv backend, one worker process only): writes return
+# once journaled and the CSV files are written every WRITE_BEHIND_INTERVAL seconds
+app.config["WRITE_BEHIND"] = os.environ.get("WRITE_BEHIND") == "1"
+app.config["WRITE_BEHIND_INTERVAL"] = float(os.environ.get("WRITE_BEHIND_INTERVAL", "1.0"))
+
+# Parse every data file in a background thread as soon as create_app() runs,
+# instead of on the first request that needs each one
+app.config["PREWARM"] = os.environ.get("PREWARM") == "1"
+
+# Milliseconds spent booting, preparing the data files and prewarming the caches
+app.config["STARTUP_TIMINGS"] = startup_timings = {}
+boot_started = time.perf_counter()
+logger = logging.getLogger("mobile_store.startup")
+
 # --- File Paths ---
 INDIVIDUAL_PHONES_FILE ="phones.csv"
 CSV_FILE = "inventory.csv"
@@ -14,55 +73,151 @@ FINISHED_FILE = "finished.csv"
 SERVICES_FILE = "services.csv"
 SOLD_FILE = "sold_phones.csv"
 TOTAL_SALES_FILE = "total_sales.csv"
-
-# --- Global Fieldnames ---
-FIELDNAMES = ["Brand", "Serial", "Model", "Box", "Charger",
-              "Bought Price", "Sell Price", "Category", "Notes", "Quantity",
-              "Customer Name", "Customer Number", "Sale Date", "Sale Time", "Service Price"]
-
-
-INDIVIDUAL_FIELDNAMES = ["Brand", "Serial", "Model", "Box", "Charger", "Bought Price", "Sell Price", "Category", "Notes", "Quantity"]
-
-# Add wrapper functions for the new file
-
-
+LEDGER_FILE = "sales_ledger.json"
+SERIALS_FILE = "serials.log"
+
+# CSV data files and the columns each one is written with
+DATA_FILES = {
+    CSV_FILE: FIELDNAMES,
+    SOLD_FILE: FIELDNAMES,
+    FINISHED_FILE: FIELDNAMES,
+    SERVICES_FILE: FIELDNAMES,
+    INDIVIDUAL_PHONES_FILE: INDIVIDUAL_FIELDNAMES,
+}
+
+# Where edit() looks for a phone, by the list name used in its Category
+LIST_FILES = {
+    "inventory": CSV_FILE,
+    "services": SERVICES_FILE,
+    "finished": FINISHED_FILE,
+}
+
+# Data files by the name used in /export/<name>.csv and as serial locations,
+# from the lowest to the highest precedence when the serial registry is
+# rebuilt (sold phones stay in phones.csv, so sold wins over phones)
+NAMED_FILES = {
+    "phones": INDIVIDUAL_PHONES_FILE,
+    SOLD: SOLD_FILE,
+    "inventory": CSV_FILE,
+    "finished": FINISHED_FILE,
+    "services": SERVICES_FILE,
+}
+
+# List an edited phone moves to, by the category chosen in the edit form;
+# sold phones leave through /sell, so "sold" has no list here
+CATEGORY_LISTS = {"available": "inventory", "inventory": "inventory", "service": "services", "finished": "finished"}
+
+# Typed record class each data file is parsed into
+RECORD_TYPES = {
+    CSV_FILE: InventoryGroup,
+    SOLD_FILE: SoldUnit,
+    FINISHED_FILE: ServiceJob,
+    SERVICES_FILE: ServiceJob,
+    INDIVIDUAL_PHONES_FILE: Phone,
+}
+
+if app.config["WRITE_BEHIND"] and app.config["STORAGE_BACKEND"] != "csv":
+    raise ValueError("WRITE_BEHIND needs the csv storage backend")
+
+# Set while Shop.call() runs code for one shop outside of its requests
+active_shop = ContextVar("active_shop", default=None)
+
+class Shop:
+    """One branch: a data directory with its own store, caches, ledger and serial registry.
+
+    Each shop's store keeps its own parsed rows and takes its own
+    transaction lock (and lock file), so writes in a large shop never hold
+    up reads in a small one.
+    """
+
+    def __init__(self, name, data_dir):
+        self.name = name
+        self.data_dir = data_dir
+        # Parsed CSV files are kept in memory and re-read only when they change on disk
+        if app.config["WRITE_BEHIND"]:
+            self.store = WriteBehindStore(data_dir, RECORD_TYPES, interval=app.config["WRITE_BEHIND_INTERVAL"])
+        else:
+            self.store = open_store(app.config["STORAGE_BACKEND"], data_dir, db_path=self.path(app.config["SQLITE_DB"]),
+                                    unique_serials=[INDIVIDUAL_PHONES_FILE], record_types=RECORD_TYPES)
+        # Exact revenue/cost/profit counters per day, brand and model
+        self.ledger = SalesLedger(self.path(LEDGER_FILE), deferred=app.config["WRITE_BEHIND"])
+        # Prefix/n-gram index over inventory and individual phones for the search box
+        self.search_index = SearchIndex()
+        # Brand -> models of the inventory for the add form
+        self.catalog = BrandCatalog()
+        # sold_phones.csv as typed columns for the /reports group-bys
+        self.sales_report = SalesReport()
+        # Serial -> the list each phone is in, for duplicate checks and edits
+        self.serials = SerialRegistry(self.path(SERIALS_FILE))
+        # Moves between inventory, services, finished and sold, one batch each
+        self.moves = MoveEngine(self.store, NAMED_FILES, registry=self.serials)
+        # Set once prepare_data() has run; startup timings in milliseconds
+        self.data_ready = threading.Event()
+        self.startup_lock = threading.Lock()
+        self.timings = {}
+        if self.ledger.deferred:
+            self.store.after_flush.append(lambda: self.call(flush_sales_totals))
+
+    def path(self, file_name):
+        return os.path.join(self.data_dir, file_name)
+
+    def call(self, function, *args):
+        """Run function with this shop as the current one, as in one of its requests."""
+        token = active_shop.set(self)
+        try:
+            return function(*args)
+        finally:
+            active_shop.reset(token)
+
+shops = {name: Shop(name, data_dir) for name, data_dir in app.config["STORES"].items()}
+app.wsgi_app = ShopSelector(app.wsgi_app, shops)
+# Keep the memoized views of every shop's files side by side
+memo.ways = len(shops)
+if app.config["STORE_METRICS"]:
+    StoreMetrics(app.config["SLOW_REQUEST_MS"]).init_app(app, {name: shop.store for name, shop in shops.items()})
+
+def current_shop():
+    """The shop of the current request or Shop.call(), else DEFAULT_STORE."""
+    shop = active_shop.get()
+    if shop is None and has_request_context():
+        shop = shops.get(request.environ.get(SHOP_ENVIRON_KEY))
+    return shop or shops[app.config["DEFAULT_STORE"]]
+
+# The current shop's objects, so routes and helpers work on whichever shop is being served
+store = LocalProxy(lambda: current_shop().store)
+ledger = LocalProxy(lambda: current_shop().ledger)
+search_index = LocalProxy(lambda: current_shop().search_index)
+catalog = LocalProxy(lambda: current_shop().catalog)
+sales_report = LocalProxy(lambda: current_shop().sales_report)
+serials = LocalProxy(lambda: current_shop().serials)
+moves = LocalProxy(lambda: current_shop().moves)
 
 
 # --- Reusable Load/Save Functions ---
-def load_data(file_path):
+def load_data(file_path, fieldnames=FIELDNAMES):
     """Load data from a given CSV file."""
-    if not os.path.exists(file_path):
-        with open(file_path, "w", newline="", encoding="utf-8") as f:
-            writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
-            writer.writeheader()
-        return []
-    with open(file_path, newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        return list(reader)
+    return store.load(file_path, fieldnames)
 
 def save_data(file_path, data, fieldnames):
     """Save a list of dicts back to a given CSV file."""
-    with open(file_path, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        if data:
-            writer.writerows(data)
+    store.save(file_path, data, fieldnames)
+
+def append_data(file_path, data, fieldnames):
+    """Append new rows to a given CSV file without rewriting it."""
+    store.append(file_path, data, fieldnames)
 
 def load_total_sales():
-    if not os.path.exists(TOTAL_SALES_FILE):
-        with open(TOTAL_SALES_FILE, "w", newline="", encoding="utf-8") as f:
-            f.write("Total Sales\n0.0")
-        return 0.0
-    with open(TOTAL_SALES_FILE, "r", encoding="utf-8") as f:
-        f.readline()
-        try:
-            return float(f.read())
-        except (ValueError, IndexError):
-            return 0.0
+    """Total revenue of all sales, as an exact Decimal from the sales ledger."""
+    return ledger.total()["revenue"]
 
 def save_total_sales(total_sales):
-    with open(TOTAL_SALES_FILE, "w", newline="", encoding="utf-8") as f:
-        f.write("Total Sales\n" + str(total_sales))
+    """Mirror the ledger total into total_sales.csv for older tools."""
+    write_text_atomic(current_shop().path(TOTAL_SALES_FILE), "Total Sales\n" + str(total_sales))
+
+def flush_sales_totals():
+    """Write the deferred ledger and total_sales.csv after a write-behind flush."""
+    if ledger.flush():
+        save_total_sales(load_total_sales())
 
 # --- Wrapper functions for specific files ---
 def load_inventory():
@@ -70,6 +225,9 @@ def load_inventory():
 
 def save_inventory(phones):
     save_data(CSV_FILE, phones, FIELDNAMES)
+
+def append_inventory(phones):
+    append_data(CSV_FILE, phones, FIELDNAMES)
     
 def load_sold():
     return load_data(SOLD_FILE)
@@ -77,67 +235,180 @@ def load_sold():
 def save_sold(sold_phones):
     save_data(SOLD_FILE, sold_phones, FIELDNAMES)
 
+def append_sold(sold_phones):
+    append_data(SOLD_FILE, sold_phones, FIELDNAMES)
+
 def load_finished():
     return load_data(FINISHED_FILE)
 
 def save_finished(finished_phones):
     save_data(FINISHED_FILE, finished_phones, FIELDNAMES)
 
+def append_finished(finished_phones):
+    append_data(FINISHED_FILE, finished_phones, FIELDNAMES)
+
 def load_services():
     return load_data(SERVICES_FILE)
 
 def save_services(services):
     save_data(SERVICES_FILE, services, FIELDNAMES)
 
+def append_services(services):
+    append_data(SERVICES_FILE, services, FIELDNAMES)
+
 
 def load_individual_phones():
-    return load_data(INDIVIDUAL_PHONES_FILE)
+    return load_data(INDIVIDUAL_PHONES_FILE, INDIVIDUAL_FIELDNAMES)
 
 def save_individual_phones(phones):
     save_data(INDIVIDUAL_PHONES_FILE, phones, INDIVIDUAL_FIELDNAMES)
-    
-# Ensure the new file is created on startup
-if not os.path.exists(INDIVIDUAL_PHONES_FILE):
-    save_individual_phones([])
 
+def append_individual_phones(phones):
+    append_data(INDIVIDUAL_PHONES_FILE, phones, INDIVIDUAL_FIELDNAMES)
+
+# --- Indexed lookups ---
+def find_by_serial(file_path, serial):
+    return store.find(file_path, {"Serial": serial}, DATA_FILES[file_path])
+
+def group_match(brand, model, box, charger, sell_price):
+    """Columns identifying one grouped inventory row."""
+    return dict(zip(GROUP_KEY, (brand, model, box, charger, sell_price)))
 
+# --- Read-only views (shared cached rows, do not modify) ---
+def inventory_rows():
+    return store.rows(CSV_FILE)
 
-# Ensure all files exist on startup
-if not os.path.exists(CSV_FILE):
-    save_inventory([])
-if not os.path.exists(SOLD_FILE):
-    save_sold([])
-if not os.path.exists(TOTAL_SALES_FILE):
-    save_total_sales(0.0)
-if not os.path.exists(FINISHED_FILE):
-    save_finished([])
-if not os.path.exists(SERVICES_FILE):
-    save_services([])
+def individual_phones_rows():
+    return store.rows(INDIVIDUAL_PHONES_FILE, INDIVIDUAL_FIELDNAMES)
+
+def services_rows():
+    return store.rows(SERVICES_FILE)
+
+def finished_rows():
+    return store.rows(FINISHED_FILE)
+    
+def rebuild_serials():
+    """Re-register every serial from the data files; returns (drift, conflicts)."""
+    with store.transaction():
+        return serials.rebuild({location: (row["Serial"] for row in store.stream(file_name, DATA_FILES[file_name]))
+                                for location, file_name in NAMED_FILES.items()})
+
+def locate_phone(serial):
+    """(list name, file, row) of a phone in inventory, services or finished.
+
+    The serial registry names the one file to look in; serials it does not
+    know, like the placeholder of grouped rows, are looked up in each list.
+    """
+    location = serials.locate(serial)
+    if location is None:
+        names = list(LIST_FILES)
+    else:
+        names = [location] if location in LIST_FILES else []
+    for name in names:
+        phone = find_by_serial(LIST_FILES[name], serial)
+        if phone:
+            return name, LIST_FILES[name], phone
+    return None, None, None
+
+def bulk_import(records):
+    """Import a batch of stock records with one write per file."""
+    with store.transaction():
+        report = import_stock(store, CSV_FILE, INDIVIDUAL_PHONES_FILE, records, serials)
+        serials.record((serial, "phones") for serial in report.serials)
+        return report
+
+# --- Search Helper Function ---
+def search_phones(query, limit=None):
+    """Search inventory groups and individual phones by brand, model, serial or notes."""
+    search_index.refresh({"inventory": inventory_rows(), "phones": individual_phones_rows()})
+    return search_index.search(query, limit=limit)
 
 # --- Dynamic Models Helper Function ---
 def get_all_brands_and_models():
-    phones = load_inventory()
-    brands_and_models = {}
-    for phone in phones:
-        brand = phone.get("Brand", "Unknown")
-        model = phone.get("Model", "Unknown")
-        if brand not in brands_and_models:
-            brands_and_models[brand] = set()
-        brands_and_models[brand].add(model)
-    # Convert sets back to lists for JSON serialization
-    return {brand: sorted(list(models)) for brand, models in brands_and_models.items()}
+    catalog.refresh(inventory_rows())
+    return catalog.brands_and_models()
+
+# Columns the service list can be sorted by
+SERVICE_COLUMNS = ["Brand", "Serial", "Model", "Service Price", "Customer Name", "Customer Number"]
+
+@app.template_global()
+def page_url(**changes):
+    """URL of the current page with some query arguments replaced."""
+    args = request.args.to_dict()
+    args.update(changes)
+    return url_for(request.endpoint, **request.view_args, **args)
 
 # --- Routes ---
 @app.route("/")
 def home():
-    return render_template("index.html")
+    today = ledger.day(datetime.now().strftime("%Y-%m-%d"))
+    return render_template("index.html", today=today)
+
+# ------------------- 📈 Sales Summary -------------------
+@app.route("/sales_summary")
+def sales_summary():
+    """Revenue, cost, profit and units from the sales ledger (no file scan)."""
+    def as_json(counters):
+        return {name: str(value) for name, value in counters.items()}
+
+    summary = {"total": as_json(ledger.total())}
+    if request.args.get("day"):
+        summary["day"] = as_json(ledger.day(request.args["day"]))
+    if request.args.get("brand"):
+        summary["brand"] = as_json(ledger.brand(request.args["brand"]))
+        if request.args.get("model"):
+            summary["model"] = as_json(ledger.model(request.args["brand"], request.args["model"]))
+    return jsonify(summary)
+
+# ------------------- 📊 Sales Reports -------------------
+def sales_report_for(start, end, by):
+    sales_report.refresh(store.rows(SOLD_FILE))
+    return sales_report.summary(start, end, by)
+
+@app.route("/reports")
+def reports():
+    start = parse_day(request.args.get("from"))
+    end = parse_day(request.args.get("to"))
+    by = [name for name in request.args.getlist("by") if name in DIMENSIONS] or ["brand"]
+    report = sales_report_for(start, end, by)
+    return render_template("reports.html", report=report, start=start, end=end, by=by,
+                           dimensions=DIMENSIONS)
+
+# ------------------- ⬇️ CSV Export -------------------
+@app.route("/export/<name>.csv")
+def export(name):
+    """Stream a data file as CSV, filtered by ?brand= and ?from=/?to= sale dates.
+
+    Rows go from disk through the filters into the response in chunks, so
+    memory use does not grow with the file; ?gzip=1 compresses the stream.
+    Only sold phones have a sale date, so date bounds on any other list
+    are refused rather than answered with an empty export.
+    """
+    if name not in NAMED_FILES:
+        abort(404)
+    if name != SOLD and (request.args.get("from") or request.args.get("to")):
+        abort(400, description=f"?from= and ?to= filter on Sale Date, which only the {SOLD} export has")
+    file_name = NAMED_FILES[name]
+    fieldnames = DATA_FILES[file_name]
+    rows = filter_rows(store.stream(file_name, fieldnames), brand=request.args.get("brand", ""),
+                       start=parse_day(request.args.get("from")), end=parse_day(request.args.get("to")))
+    chunks = csv_chunks(rows, fieldnames)
+    download = f"{name}.csv"
+    mimetype = "text/csv"
+    if request.args.get("gzip") == "1":
+        chunks = gzip_chunks(chunks)
+        download += ".gz"
+        mimetype = "application/gzip"
+    return Response(stream_with_context(chunks), mimetype=mimetype,
+                    headers={"Content-Disposition": f"attachment; filename={download}"})
 
 # ------------------- 📦 Inventory -------------------
 @app.route("/inventory")
 def inventory():
-    phones = load_inventory()
-    total_quantity = sum(int(p.get("Quantity", 0)) for p in phones)
-    return render_template("inventory.html", phones=phones, total_quantity=total_quantity)
+    options = read_options(request.args, FIELDNAMES)
+    page, total_quantity = page_of("inventory", inventory_rows(), options)
+    return render_template("inventory.html", phones=page.items, page=page, options=options,
+                           columns=FIELDNAMES, total_quantity=total_quantity)
 
 # ------------------- ➕ Add Phone -------------------
 # ------------------- ➕ Add Phone -------------------
@@ -159,45 +430,8 @@ def add():
         new_serials = request.form.getlist("serials")
         new_quantity = len(new_serials)
 
-        # Update the main inventory.csv (grouped)
-        phones = load_inventory()
-        found_phone = None
-        for phone in phones:
-            if (phone["Brand"] == brand and
-                phone["Model"] == model and
-                phone["Box"] == box and
-                phone["Charger"] == charger and
-                phone["Sell Price"] == sell_price):
-                found_phone = phone
-                break
-
-        if found_phone:
-            try:
-                current_quantity = int(found_phone.get("Quantity", "0"))
-                found_phone["Quantity"] = str(current_quantity + new_quantity)
-                flash(f"Quantity for {found_phone['Model']} updated to {found_phone['Quantity']}!", "success")
-            except ValueError:
-                flash("Error: Invalid quantity value.", "danger")
-        else:
-            new_phone_data = {
-                "Brand": brand,
-                "Model": model,
-                "Box": box,
-                "Charger": charger,
-                "Bought Price": bought_price,
-                "Sell Price": sell_price,
-                "Category": category,
-                "Notes": notes,
-                "Quantity": str(new_quantity),
-                "Serial": "0" # Placeholder for the main inventory view
-            }
-            phones.append(new_phone_data)
-            flash(f"New product ({model}) added successfully!", "success")
-
-        save_inventory(phones)
-
-        # Update the new individual_phones.csv (one entry per serial)
-        individual_phones = load_individual_phones()
+        # One entry per serial for individual_phones.csv
+        individual_phones = []
         for serial in new_serials:
             individual_record = {
                 "Brand": brand,
@@ -212,51 +446,138 @@ def add():
                 "Quantity": "1" # Always 1 for individual records
             }
             individual_phones.append(individual_record)
-        
-        save_individual_phones(individual_phones)
-        
+
+        try:
+            with store.transaction():
+                # Serials the shop has seen are rejected before anything is written
+                if len(set(new_serials)) < new_quantity or any(serial in serials for serial in new_serials):
+                    raise DuplicateSerialError()
+
+                # Update the main inventory.csv (grouped)
+                match = group_match(brand, model, box, charger, sell_price)
+                found_phone = store.find(CSV_FILE, match)
+
+                if found_phone:
+                    if found_phone.quantity is None:
+                        message = ("Error: Invalid quantity value.", "danger")
+                    else:
+                        found_phone["Quantity"] = found_phone.quantity + new_quantity
+                        store.update(CSV_FILE, match, {"Quantity": found_phone["Quantity"]})
+                        message = (f"Quantity for {found_phone['Model']} updated to {found_phone['Quantity']}!", "success")
+                else:
+                    new_phone_data = {
+                        "Brand": brand,
+                        "Model": model,
+                        "Box": box,
+                        "Charger": charger,
+                        "Bought Price": bought_price,
+                        "Sell Price": sell_price,
+                        "Category": category,
+                        "Notes": notes,
+                        "Quantity": str(new_quantity),
+                        "Serial": "0" # Placeholder for the main inventory view
+                    }
+                    append_inventory([new_phone_data])
+                    message = (f"New product ({model}) added successfully!", "success")
+
+                append_individual_phones(individual_phones)
+                serials.record((serial, "phones") for serial in new_serials)
+        except DuplicateSerialError:
+            message = ("Error: One of the serial numbers is already registered.", "danger")
+        flash(*message)
+
         return redirect(url_for("inventory"))
 
-    brands_and_models = get_all_brands_and_models()
-    return render_template("add.html", brands_and_models=brands_and_models)
+    return render_template("add.html")
+
+
+# ------------------- 📥 Bulk Stock Intake -------------------
+@app.route("/bulk_add", methods=["GET", "POST"])
+def bulk_add():
+    if request.method == "POST":
+        defaults = {
+            "Brand": request.form.get("brand", ""),
+            "Model": request.form.get("model", ""),
+            "Box": "Yes" if request.form.get("box") else "No",
+            "Charger": "Yes" if request.form.get("charger") else "No",
+            "Bought Price": request.form.get("bought_price", ""),
+            "Sell Price": request.form.get("sell_price", ""),
+            "Category": request.form.get("category", ""),
+            "Notes": request.form.get("notes", ""),
+        }
+        upload = request.files.get("upload")
+        text = upload.read().decode("utf-8", errors="replace") if upload else ""
+        text = text or request.form.get("scans", "")
+        if not text.strip():
+            flash("Please upload a file or paste scanned serials.", "danger")
+            return redirect(url_for("bulk_add"))
+        report = bulk_import(parse_upload(text, defaults))
+        return render_template("bulk_add.html", report=report, throughput=units_per_second(report))
+    return render_template("bulk_add.html", report=None)
+
+# ------------------- 🗂 Brand/Model Catalog -------------------
+@app.route("/api/catalog")
+def api_catalog():
+    """Brand -> models for the add form; browsers revalidate it with ETag/Last-Modified."""
+    response = jsonify(get_all_brands_and_models())
+    response.set_etag(catalog.etag)
+    response.last_modified = catalog.last_modified
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
 
 # ------------------- 💰 Sells Section -------------------
+def group_positions(rows):
+    """GROUP_KEY -> positions of the rows in that group."""
+    positions = {}
+    for position, row in enumerate(rows):
+        positions.setdefault(tuple(row.get(key) for key in GROUP_KEY), []).append(position)
+    return positions
+
+def available_for_sale(search_query):
+    """(available inventory rows matching the search, memo view name or None)."""
+    phones = inventory_rows()
+    available_phones = memo.get(("available",), phones, lambda: tuple(
+        p for p in phones if p.get("Category", "").lower() == "available"))
+    if not search_query:
+        return available_phones, "sells"
+    # Individual phones match through the inventory group they belong to
+    groups = {tuple(row.get(key) for key in GROUP_KEY) for _, row in search_phones(search_query)}
+    by_group = memo.get(("available_by_group",), phones, lambda: group_positions(available_phones))
+    positions = sorted(position for key in groups for position in by_group.get(key, ()))
+    return [available_phones[position] for position in positions], None
+
 @app.route('/sells')
 def sells():
-    phones = load_inventory()
-    available_phones = [p for p in phones if p.get("Category", "").lower() == "available"]
     search_query = request.args.get('search', '').lower()
-    if search_query:
-        available_phones = [
-            p for p in available_phones
-            if p.get("Model", "").lower() == search_query or p.get("Brand", "").lower() == search_query
-        ]
-    total_available_quantity = sum(int(p.get("Quantity", 0)) for p in available_phones)
+    available_phones, view_name = available_for_sale(search_query)
+    options = read_options(request.args, INDIVIDUAL_FIELDNAMES)
+    page, total_available_quantity = page_of(view_name, available_phones, options)
     return render_template(
         "sells.html", 
-        phones=available_phones, 
+        phones=page.items, 
+        page=page,
+        options=options,
+        columns=INDIVIDUAL_FIELDNAMES,
         total_available_quantity=total_available_quantity,
         search_query=search_query
     )
 
+# ------------------- 🔎 As-you-type Search -------------------
+@app.route("/api/search")
+def api_search():
+    query = request.args.get("q", "")
+    limit = min(max(request.args.get("limit", 20, type=int), 1), 100)
+    results = []
+    for source, row in search_phones(query, limit=limit):
+        term = row["Serial"] if source == "phones" else row["Model"]
+        results.append(dict(row, source=source, url=url_for("sells", search=term)))
+    return jsonify(query=query, results=results)
+
 # ------------------- ✏ Edit Phone -------------------
 @app.route("/edit/<serial>", methods=["GET", "POST"])
 def edit(serial):
-    phones = load_inventory()
-    phone = next((p for p in phones if p["Serial"] == serial), None)
-    
-    current_list_name = "inventory"
-
-    if not phone:
-        services = load_services()
-        phone = next((p for p in services if p["Serial"] == serial), None)
-        current_list_name = "services"
-
-    if not phone:
-        finished = load_finished()
-        phone = next((p for p in finished if p["Serial"] == serial), None)
-        current_list_name = "finished"
+    current_list_name, current_file, phone = locate_phone(serial)
 
     if not phone:
         flash("Phone not found!", "danger")
@@ -270,48 +591,37 @@ def edit(serial):
         if "Model" in phone and request.form.get("model"):
             phone["Model"] = request.form.get("model").upper()
         
-        new_category = request.form.get("Category", "").lower()
-
-        if new_category == current_list_name:
-            if current_list_name == "inventory":
-                save_inventory(phones)
-            elif current_list_name == "services":
-                save_services(services)
-            elif current_list_name == "finished":
-                save_finished(finished)
-        else:
-            if current_list_name == "inventory":
-                phones = [p for p in phones if p["Serial"] != serial]
-                save_inventory(phones)
-                target_list = load_inventory()
-            elif current_list_name == "services":
-                services = [p for p in services if p["Serial"] != serial]
-                save_services(services)
-                target_list = load_services()
-            elif current_list_name == "finished":
-                finished = [p for p in finished if p["Serial"] != serial]
-                save_finished(finished)
-                target_list = load_finished()
-
-            if new_category == "inventory":
-                target_list = load_inventory()
-                target_list.append(phone)
-                save_inventory(target_list)
-                flash("Phone moved to Inventory.", "success")
-            elif new_category == "service":
-                target_list = load_services()
-                target_list.append(phone)
-                save_services(target_list)
-                flash("Phone moved to Service.", "success")
-            elif new_category == "finished":
-                target_list = load_finished()
-                target_list.append(phone)
-                save_finished(target_list)
-                flash("Phone marked as Finished.", "success")
-        
+        # The edit form names the field "category"; older forms sent "Category"
+        new_category = (request.form.get("category") or request.form.get("Category", "")).lower()
+
+        new_list_name = CATEGORY_LISTS.get(new_category)
+        if new_list_name is None:
+            if new_category == SOLD:
+                flash("Use Sell to mark a phone as sold.", "danger")
+            else:
+                flash(f"Unknown category: {new_category or 'none'}", "danger")
+            return redirect(url_for("edit", serial=serial))
+        if new_list_name == "inventory":
+            phone["Category"] = "available"
+        elif new_list_name == "services":
+            phone["Category"] = "service"
+
+        with store.transaction():
+            if new_list_name == current_list_name:
+                store.update(current_file, {"Serial": serial}, phone)
+            else:
+                # Edits may move a phone between any two lists
+                moves.move(current_list_name, new_list_name, {"Serial": serial}, changes=phone, check=False)
+                if new_list_name == "inventory":
+                    flash("Phone moved to Inventory.", "success")
+                elif new_list_name == "services":
+                    flash("Phone moved to Service.", "success")
+                else:
+                    flash("Phone marked as Finished.", "success")
+
         return redirect(url_for("inventory"))
 
-    return render_template("edit.html", phone=phone)
+    return render_template("edit.html", phone=phone, current_list=current_list_name)
 
 # ------------------- ❌ Delete Phone -------------------
 # ------------------- ❌ Delete Phone -------------------
@@ -324,41 +634,62 @@ def delete():
     charger = request.form["charger"]
     sell_price = request.form["sell_price"]
 
-    phones = load_inventory()
-    phone_to_delete = None
-
-    for phone in phones:
-        if (phone["Brand"] == brand and
-            phone["Model"] == model and
-            phone["Box"] == box and
-            phone["Charger"] == charger and
-            phone["Sell Price"] == sell_price):
-            phone_to_delete = phone
-            break
+    match = group_match(brand, model, box, charger, sell_price)
+    with store.transaction():
+        phone_to_delete = store.find(CSV_FILE, match)
 
-    if phone_to_delete:
-        try:
-            current_quantity = int(phone_to_delete.get("Quantity", 1))
-            if current_quantity > 1:
-                phone_to_delete["Quantity"] = str(current_quantity - 1)
+        if phone_to_delete:
+            current_quantity = phone_to_delete.quantity
+            if current_quantity is None:
+                flash("Error: Invalid quantity for the selected item.", "danger")
+            elif current_quantity > 1:
+                store.update(CSV_FILE, match, {"Quantity": str(current_quantity - 1)})
                 flash(f"One unit of {phone_to_delete['Model']} has been removed.", "success")
             else:
-                phones.remove(phone_to_delete)
+                store.remove(CSV_FILE, match)
                 flash(f"The last unit of {phone_to_delete['Model']} has been deleted.", "success")
-            save_inventory(phones)
-        except (ValueError, KeyError):
-            flash("Error: Invalid quantity for the selected item.", "danger")
-    else:
-        flash("Phone not found.", "danger")
+        else:
+            flash("Phone not found.", "danger")
 
     return redirect(url_for("inventory"))
 
 
 # ------------------- 💵 Sell Product Route -------------------
+def sell_units(serial, customer_name, customer_number, sold_serials):
+    """Sell units of the inventory row with this serial in one move; return the sold rows.
+
+    Raises LookupError when the row is gone and ValueError when more units
+    are asked for than it holds.
+    """
+    current_time = datetime.now()
+    with store.transaction():
+        # Read the row inside the transaction so concurrent sales see each other's quantity
+        phone_to_sell = find_by_serial(CSV_FILE, serial)
+        if not phone_to_sell:
+            raise LookupError("Product not found!")
+        current_quantity = phone_to_sell.quantity or 0
+        # This is the core check. It compares the number of submitted serials
+        # with the available quantity.
+        if len(sold_serials) > current_quantity:
+            raise ValueError(f"Error: You can only sell up to {current_quantity} of this phone.")
+
+        sale = {
+            "Customer Name": customer_name,
+            "Customer Number": customer_number,
+            "Sale Date": current_time.strftime("%Y-%m-%d"),
+            "Sale Time": current_time.strftime("%H:%M:%S"),
+        }
+        # One batch lowers the group's Quantity and appends the sold phones
+        sold_phones = moves.move("inventory", SOLD, {"Serial": serial}, changes=sale,
+                                 units=[{"Serial": sold_serial} for sold_serial in sold_serials]).moved
+        ledger.record_sales(sold_phones)
+        if not ledger.deferred:
+            save_total_sales(load_total_sales())
+    return sold_phones
+
 @app.route("/sell/<serial>", methods=["GET", "POST"])
 def sell_product(serial):
-    phones = load_inventory()
-    phone_to_sell = next((p for p in phones if p["Serial"] == serial), None)
+    phone_to_sell = find_by_serial(CSV_FILE, serial)
 
     if not phone_to_sell:
         flash("Product not found!", "danger")
@@ -371,42 +702,15 @@ def sell_product(serial):
         customer_number = request.form.get("customer_number")
         sold_serials = request.form.getlist("serials") # This is a list of all serial inputs
 
-        current_quantity = int(phone_to_sell.get("Quantity", 0))
-        # This is the core check. It compares the number of submitted serials
-        # with the available quantity.
-        if len(sold_serials) > current_quantity:
-            flash(f"Error: You can only sell up to {current_quantity} of this phone.", "danger")
+        try:
+            sell_units(serial, customer_name, customer_number, sold_serials)
+        except LookupError as e:
+            flash(str(e), "danger")
+            return redirect(url_for("sells"))
+        except ValueError as e:
+            flash(str(e), "danger")
             return redirect(url_for("sell_product", serial=serial))
 
-        phone_to_sell["Quantity"] = str(current_quantity - len(sold_serials))
-        if int(phone_to_sell["Quantity"]) <= 0:
-            phones = [p for p in phones if p["Serial"] != serial]
-        save_inventory(phones)
-        
-        sold_phones = load_sold()
-        total_sales = load_total_sales()
-        
-        for sold_serial in sold_serials:
-            sold_phone_record = phone_to_sell.copy()
-            sold_phone_record.update({
-                "Serial": sold_serial,
-                "Customer Name": customer_name,
-                "Customer Number": customer_number,
-                "Sale Date": current_time.strftime("%Y-%m-%d"),
-                "Sale Time": current_time.strftime("%H:%M:%S"),
-                "Quantity": "1"
-            })
-            sold_phones.append(sold_phone_record)
-            
-            try:
-                sell_price = float(phone_to_sell.get("Sell Price", 0))
-                total_sales += sell_price
-            except (ValueError, KeyError):
-                pass
-        
-        save_sold(sold_phones)
-        save_total_sales(total_sales)
-        
         flash(f"Sale confirmed for {len(sold_serials)} phones to {customer_name}.", "success")
         return redirect(url_for("sells"))
 
@@ -416,8 +720,10 @@ def sell_product(serial):
 # ------------------- 🔧 Service Section -------------------
 @app.route("/service")
 def service():
-    phones = load_services()
-    return render_template("service.html", phones=phones)
+    options = read_options(request.args, SERVICE_COLUMNS)
+    page, _ = page_of("service", services_rows(), options, price_column="Service Price")
+    return render_template("service.html", phones=page.items, page=page, options=options,
+                           columns=SERVICE_COLUMNS)
 
 # ------------------- ➕ Add Phone to Service -------------------
 @app.route("/add_service", methods=["GET", "POST"])
@@ -435,9 +741,13 @@ def add_service():
             "Box": "", "Charger": "", "Bought Price": "", "Sell Price": "", 
             "Quantity": "1", "Sale Date": "", "Sale Time": ""
         }
-        services = load_services()
-        services.append(new_service_phone)
-        save_services(services)
+        serial = new_service_phone["Serial"]
+        with store.transaction():
+            if serials.in_shop(serial):
+                flash(f"Error: Serial {serial} is already in the shop.", "danger")
+                return redirect(url_for("add_service"))
+            append_services([new_service_phone])
+            serials.record([(serial, "services")])
         flash(f"Phone ({new_service_phone['Model']}) added to service successfully!", "success")
         return redirect(url_for("service"))
     return render_template("add_service.html")
@@ -446,20 +756,30 @@ def add_service():
 # ------------------- ✅ Finish Service Route -------------------
 @app.route("/finish_service/<serial>", methods=["POST"])
 def finish_service(serial):
-    services = load_services()
-    phone_to_finish = next((p for p in services if p["Serial"] == serial), None)
-    if not phone_to_finish:
+    move = moves.move("services", "finished", {"Serial": serial})
+    if not move:
         flash("Service item not found!", "danger")
         return redirect(url_for("service"))
-    services = [p for p in services if p["Serial"] != serial]
-    save_services(services)
-    finished_phones = load_finished()
-    finished_phones.append(phone_to_finish)
-    save_finished(finished_phones)
+    phone_to_finish = move.row
     flash(f"Service for {phone_to_finish['Model']} has been marked as finished.", "success")
     return redirect(url_for("service"))
 
 # ------------------- 🛠 Send to Service Route -------------------
+def send_unit_to_service(match):
+    """Move one unit of the inventory group matching ``match`` to services; return the Move.
+
+    Raises LookupError when no group matches and ValueError when its
+    Quantity is unreadable.
+    """
+    with store.transaction():
+        phone_to_move = store.find(CSV_FILE, match)
+        if not phone_to_move:
+            raise LookupError("Phone not found in inventory!")
+        if phone_to_move.quantity is None:
+            raise ValueError("Error processing the selected item.")
+        # One unit goes to the services list; the group row goes with its last unit
+        return moves.move("inventory", "services", match, changes={"Category": "service"}, units=[{}])
+
 @app.route("/send_to_service", methods=["POST"])
 def send_to_service():
     brand = request.form["brand"]
@@ -468,72 +788,413 @@ def send_to_service():
     charger = request.form["charger"]
     sell_price = request.form["sell_price"]
 
-    inventory_phones = load_inventory()
-    phone_to_move = None
-
-    for phone in inventory_phones:
-        if (phone["Brand"] == brand and
-            phone["Model"] == model and
-            phone["Box"] == box and
-            phone["Charger"] == charger and
-            phone["Sell Price"] == sell_price):
-            phone_to_move = phone
-            break
-
-    if not phone_to_move:
-        flash("Phone not found in inventory!", "danger")
-        return redirect(url_for("inventory"))
-    
     try:
-        current_quantity = int(phone_to_move.get("Quantity", 1))
-        if current_quantity > 1:
-            phone_to_move["Quantity"] = str(current_quantity - 1)
-            # Create a new, single-unit record for the services list
-            service_record = phone_to_move.copy()
-            service_record['Quantity'] = '1'
-            service_record['Category'] = 'service'
-            services = load_services()
-            services.append(service_record)
-            save_services(services)
-        else:
-            # If it's the last one, move the original record
-            inventory_phones.remove(phone_to_move)
-            phone_to_move['Category'] = 'service'
-            services = load_services()
-            services.append(phone_to_move)
-            save_services(services)
-
-        save_inventory(inventory_phones)
-        flash(f"Phone {phone_to_move['Model']} has been sent to service.", "success")
-    
-    except (ValueError, KeyError):
-        flash("Error processing the selected item.", "danger")
-
+        phone_to_move = send_unit_to_service(group_match(brand, model, box, charger, sell_price)).row
+    except (LookupError, ValueError) as e:
+        flash(str(e), "danger")
+        return redirect(url_for("inventory"))
+    flash(f"Phone {phone_to_move['Model']} has been sent to service.", "success")
     return redirect(url_for("inventory"))
 
 # ------------------- ✅ Finished Service Section -------------------
 @app.route("/finished")
 def finished():
-    finished_phones = load_finished()
-    return render_template("finished.html", phones=finished_phones)
+    options = read_options(request.args, FIELDNAMES)
+    page, _ = page_of("finished", finished_rows(), options)
+    return render_template("finished.html", phones=page.items, page=page, options=options,
+                           columns=FIELDNAMES)
 
 
 # ------------------- 📦 Move to Inventory Route -------------------
 @app.route("/move_to_inventory/<serial>", methods=["POST"])
 def move_to_inventory(serial):
-    finished_phones = load_finished()
-    phone_to_move = next((p for p in finished_phones if p["Serial"] == serial), None)
-    if not phone_to_move:
+    move = moves.move("finished", "inventory", {"Serial": serial}, changes={"Category": "available"})
+    if not move:
         flash("Finished phone not found!", "danger")
         return redirect(url_for("finished"))
-    finished_phones = [p for p in finished_phones if p["Serial"] != serial]
-    save_finished(finished_phones)
-    phone_to_move['Category'] = 'available'
-    inventory_phones = load_inventory()
-    inventory_phones.append(phone_to_move)
-    save_inventory(inventory_phones)
+    phone_to_move = move.row
     flash(f"Phone {phone_to_move['Model']} has been moved back to inventory.", "success")
     return redirect(url_for("finished"))
 
+# ------------------- 🔌 JSON API -------------------
+# The list endpoints answer with an ETag built from the store's version of
+# the files they read; a poll with a matching If-None-Match gets a 304
+# before any file is parsed or any JSON is built.
+def data_etag(*file_names):
+    """ETag of a response built from these files for the current shop, path and query."""
+    parts = [current_shop().name, request.full_path]
+    parts.extend(store.version(file_name, DATA_FILES[file_name]) for file_name in file_names)
+    return hashlib.sha1("\0".join(parts).encode("utf-8")).hexdigest()
+
+def conditional_json(file_names, build):
+    """jsonify(build()) with an ETag, or 304 Not Modified when the client has it already."""
+    etag = data_etag(*file_names)
+    if request.if_none_match.star_tag or etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
+
+def page_json(page, **totals):
+    return dict(items=[dict(row) for row in page.items], page=page.number, per_page=page.per_page,
+                total=page.total, pages=page.pages, **totals)
+
+def api_error(message, status):
+    return jsonify(error=message), status
+
+def api_form():
+    """Fields of a JSON object body, or of a form post."""
+    data = request.get_json(silent=True)
+    return data if isinstance(data, dict) else request.form
+
+@app.route("/api/inventory")
+def api_inventory():
+    def build():
+        options = read_options(request.args, FIELDNAMES)
+        page, total_quantity = page_of("inventory", inventory_rows(), options)
+        return page_json(page, total_quantity=total_quantity)
+    return conditional_json([CSV_FILE], build)
+
+@app.route("/api/sells")
+def api_sells():
+    def build():
+        available_phones, view_name = available_for_sale(request.args.get("search", "").lower())
+        options = read_options(request.args, INDIVIDUAL_FIELDNAMES)
+        page, total_available_quantity = page_of(view_name, available_phones, options)
+        return page_json(page, total_available_quantity=total_available_quantity)
+    return conditional_json([CSV_FILE, INDIVIDUAL_PHONES_FILE], build)
+
+@app.route("/api/service")
+def api_service():
+    def build():
+        options = read_options(request.args, SERVICE_COLUMNS)
+        page, _ = page_of("service", services_rows(), options, price_column="Service Price")
+        return page_json(page)
+    return conditional_json([SERVICES_FILE], build)
+
+@app.route("/api/finished")
+def api_finished():
+    def build():
+        options = read_options(request.args, FIELDNAMES)
+        page, _ = page_of("finished", finished_rows(), options)
+        return page_json(page)
+    return conditional_json([FINISHED_FILE], build)
+
+@app.route("/api/sell/<serial>", methods=["POST"])
+def api_sell(serial):
+    form = api_form()
+    sold_serials = form.getlist("serials") if hasattr(form, "getlist") else form.get("serials") or []
+    if not isinstance(sold_serials, list):
+        return api_error("serials must be a list", 400)
+    if not sold_serials:
+        return api_error("serials must not be empty", 400)
+    try:
+        sold_phones = sell_units(serial, form.get("customer_name"), form.get("customer_number"),
+                                 [str(sold_serial) for sold_serial in sold_serials])
+    except LookupError as e:
+        return api_error(str(e), 404)
+    except ValueError as e:
+        return api_error(str(e), 409)
+    return jsonify(sold=[dict(phone) for phone in sold_phones])
+
+@app.route("/api/send_to_service", methods=["POST"])
+def api_send_to_service():
+    form = api_form()
+    try:
+        match = group_match(*(str(form[name]) for name in ("brand", "model", "box", "charger", "sell_price")))
+    except KeyError as e:
+        return api_error(f"Missing field {e.args[0]}", 400)
+    try:
+        move = send_unit_to_service(match)
+    except LookupError as e:
+        return api_error(str(e), 404)
+    except ValueError as e:
+        return api_error(str(e), 409)
+    return jsonify(moved=dict(move.moved[0]))
+
+@app.route("/api/finish_service/<serial>", methods=["POST"])
+def api_finish_service(serial):
+    move = moves.move("services", "finished", {"Serial": serial})
+    if not move:
+        return api_error("Service item not found!", 404)
+    return jsonify(moved=dict(move.moved[0]))
+
+@app.route("/api/move_to_inventory/<serial>", methods=["POST"])
+def api_move_to_inventory(serial):
+    move = moves.move("finished", "inventory", {"Serial": serial}, changes={"Category": "available"})
+    if not move:
+        return api_error("Finished phone not found!", 404)
+    return jsonify(moved=dict(move.moved[0]))
+
+# ------------------- 🏬 All Stores -------------------
+def store_totals():
+    """Stock and sales of the current shop, for the all-stores view."""
+    prepare_data()
+    stock = inventory_rows()
+    return {
+        "units_in_stock": memo_quantity_total("inventory", stock),
+        "stock_value": memo.get(("stock_value",), stock, lambda: sum(
+            ((typed(row, "Sell Price") or 0) * (typed(row, "Quantity") or 0) for row in stock), Decimal(0))),
+        "in_service": len(services_rows()),
+        "finished": len(finished_rows()),
+        "sales": ledger.total(),
+        "today": ledger.day(datetime.now().strftime("%Y-%m-%d")),
+    }
+
+def all_store_totals():
+    """(totals per shop, totals of all shops), each shop queried in parallel."""
+    per_store = fan_out(shops, lambda shop: shop.call(store_totals))
+    combined = {}
+    for totals in per_store.values():
+        for name, value in totals.items():
+            if isinstance(value, dict):
+                section = combined.setdefault(name, {})
+                for counter, amount in value.items():
+                    section[counter] = section.get(counter, 0) + amount
+            else:
+                combined[name] = combined.get(name, 0) + value
+    return per_store, combined
+
+@app.route("/stores")
+def stores():
+    per_store, combined = all_store_totals()
+    return render_template("stores.html", stores=per_store, combined=combined,
+                           root=request.environ.get(SHOP_ROOT_KEY, ""))
+
+@app.route("/api/stores")
+def api_stores():
+    def as_json(totals):
+        return {name: as_json(value) if isinstance(value, dict) else str(value) for name, value in totals.items()}
+
+    per_store, combined = all_store_totals()
+    return jsonify(stores={name: as_json(totals) for name, totals in per_store.items()}, total=as_json(combined))
+
+# ------------------- 🚀 Startup -------------------
+# Importing the app reads no data: each shop's files are prepared on its
+# first request and each one is parsed when a page first needs it, or ahead
+# of time by the prewarm thread, so a new worker accepts requests at once.
+prewarm_thread = None
+
+def elapsed_ms(started):
+    return round((time.perf_counter() - started) * 1000, 1)
+
+def prepare_data():
+    """Finish interrupted writes, create missing files and rebuild derived state, once per shop."""
+    shop = current_shop()
+    if shop.data_ready.is_set():
+        return
+    with shop.startup_lock:
+        if shop.data_ready.is_set():
+            return
+        started = time.perf_counter()
+        os.makedirs(shop.data_dir, exist_ok=True)
+        # Finish any move cut short by a crash (and, with write-behind, replay
+        # the journal), then ensure all files exist
+        store.recover()
+        replayed = store.replayed if app.config["WRITE_BEHIND"] else 0
+        journal = shop.path(WRITE_BEHIND_JOURNAL)
+        if not app.config["WRITE_BEHIND"] and os.path.exists(journal) and os.path.getsize(journal):
+            # Changes journaled while write-behind was on still reach the files
+            replay_store = WriteBehindStore(shop.data_dir, RECORD_TYPES, interval=0)
+            replay_store.recover()
+            replay_store.close()
+            replayed = replay_store.replayed
+        for file_name, fieldnames in DATA_FILES.items():
+            store.ensure(file_name, fieldnames)
+        # After an unclean write-behind shutdown the deferred ledger may lack replayed sales
+        if replayed or not os.path.exists(shop.path(LEDGER_FILE)):
+            ledger.rebuild(store.rows(SOLD_FILE))
+        if replayed or not os.path.exists(shop.path(TOTAL_SALES_FILE)):
+            save_total_sales(load_total_sales())
+        if not os.path.exists(shop.path(SERIALS_FILE)):
+            rebuild_serials()
+        shop.timings["prepare_ms"] = elapsed_ms(started)
+        shop.data_ready.set()
+    logger.info("Store %s prepared in %.1f ms", shop.name, shop.timings["prepare_ms"])
+
+def prewarm_caches():
+    """Parse every data file of the current shop and build its search, catalog and report state."""
+    shop = current_shop()
+    started = time.perf_counter()
+    try:
+        prepare_data()
+        for file_name, fieldnames in DATA_FILES.items():
+            store.rows(file_name, fieldnames)
+        search_index.refresh({"inventory": inventory_rows(), "phones": individual_phones_rows()})
+        catalog.refresh(inventory_rows())
+        sales_report.refresh(store.rows(SOLD_FILE))
+    except Exception:
+        logger.exception("Prewarming store %s failed; its files are read on first use instead", shop.name)
+        return
+    shop.timings["prewarm_ms"] = elapsed_ms(started)
+    logger.info("Store %s prewarmed in %.1f ms", shop.name, shop.timings["prewarm_ms"])
+
+@app.before_request
+def ensure_data_ready():
+    if request.endpoint != "health":
+        prepare_data()
+
+@app.context_processor
+def store_context():
+    return {"current_store": current_shop().name, "store_names": list(shops)}
+
+@app.route("/health")
+def health():
+    """Liveness and startup progress; answers without touching the data files."""
+    shop = current_shop()
+    return jsonify(store=shop.name, ready=shop.data_ready.is_set(), prewarmed="prewarm_ms" in shop.timings,
+                   timings=dict(startup_timings, **shop.timings))
+
+def create_app(prewarm=None):
+    """Return the app, ready to serve before any data file has been read.
+
+    Use it as the entry point of a WSGI server ("demoV11:create_app()").
+    With ``prewarm`` (default: the PREWARM setting) a background thread
+    parses the data files of every shop right away, so early requests find
+    them cached; requests arriving meanwhile wait for a file being parsed
+    rather than parsing it again.
+    """
+    global prewarm_thread
+    if prewarm is None:
+        prewarm = app.config["PREWARM"]
+    if prewarm and prewarm_thread is None:
+        prewarm_thread = threading.Thread(target=fan_out, args=(shops, lambda shop: shop.call(prewarm_caches)),
+                                          name="prewarm", daemon=True)
+        prewarm_thread.start()
+    startup_timings.setdefault("boot_ms", elapsed_ms(boot_started))
+    logger.info("App ready in %.1f ms%s", startup_timings["boot_ms"], ", prewarming caches" if prewarm else "")
+    return app
+
+# ------------------- 🧹 Maintenance Commands -------------------
+@app.cli.command("compact")
+def compact_command():
+    """Rewrite every CSV data file in canonical form (run periodically)."""
+    prepare_data()
+    for file_name, fieldnames in DATA_FILES.items():
+        store.compact(file_name, fieldnames)
+        click.echo(f"Compacted {file_name}")
+
+@app.cli.command("import-stock")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--brand", default="")
+@click.option("--model", default="")
+@click.option("--box", is_flag=True)
+@click.option("--charger", is_flag=True)
+@click.option("--bought-price", default="0")
+@click.option("--sell-price", default="")
+@click.option("--category", default="available")
+@click.option("--notes", default="")
+def import_stock_command(path, brand, model, box, charger, bought_price, sell_price, category, notes):
+    """Bulk-add units from a CSV file or a barcode scan list."""
+    prepare_data()
+    defaults = {
+        "Brand": brand, "Model": model,
+        "Box": "Yes" if box else "No", "Charger": "Yes" if charger else "No",
+        "Bought Price": bought_price, "Sell Price": sell_price,
+        "Category": category, "Notes": notes,
+    }
+    with open(path, encoding="utf-8") as f:
+        report = bulk_import(parse_upload(f.read(), defaults))
+    click.echo(f"{report.accepted} units added ({report.groups_updated} groups updated, "
+               f"{report.groups_created} new) in {report.seconds:.2f}s, "
+               f"{units_per_second(report):.0f} units/s")
+    for line_no, serial, reason in report.rejected:
+        click.echo(f"Rejected line {line_no} ({serial or '-'}): {reason}")
+
+@app.cli.command("rebuild-ledger")
+def rebuild_ledger_command():
+    """Recompute the sales ledger from sold_phones.csv and report any drift."""
+    prepare_data()
+    drift = ledger.rebuild(store.rows(SOLD_FILE))
+    save_total_sales(load_total_sales())
+    if not drift:
+        click.echo("Sales ledger matches sold_phones.csv")
+    for section, keys in drift.items():
+        for key, delta in sorted(keys.items()):
+            changes = ", ".join(f"{name} {value:+}" for name, value in delta.items())
+            click.echo(f"Drift in {section} {key or 'total'}: {changes}")
+
+@app.cli.command("check-serials")
+def check_serials_command():
+    """Rebuild the serial registry from the data files and report what differed."""
+    prepare_data()
+    drift, conflicts = rebuild_serials()
+    for serial, (stored, rebuilt) in sorted(drift.items()):
+        click.echo(f"Serial {serial}: registered in {stored or '-'}, found in {rebuilt or '-'}")
+    for serial, locations in sorted(conflicts.items()):
+        click.echo(f"Serial {serial} is in more than one list: {', '.join(locations)}")
+    click.echo(f"{len(serials)} serials registered, {len(drift)} corrected, {len(conflicts)} in several lists")
+
+@app.cli.command("check-integrity")
+@click.option("--incremental", is_flag=True, help="Only check rows changed since the last run.")
+@click.option("--fix", is_flag=True, help="Repair what can be repaired unambiguously.")
+def check_integrity_command(incremental, fix):
+    """Reconcile inventory Quantities with phones.csv serials and check numeric columns."""
+    prepare_data()
+    shop = current_shop()
+    if app.config["WRITE_BEHIND"]:
+        shop.store.flush()
+    checker = IntegrityChecker(shop.store, NAMED_FILES, DATA_FILES, shop.path(INTEGRITY_DIR), registry=shop.serials)
+    report = checker.check(incremental=incremental)
+    for mismatch in report.mismatches:
+        group = " ".join(mismatch.group.values())
+        click.echo(f"Group {group}: Quantity {mismatch.quantity}, {mismatch.expected} serials in stock"
+                   + (f" (surplus: {', '.join(mismatch.surplus)})" if mismatch.surplus else ""))
+    for serial, group in report.orphans:
+        click.echo(f"Serial {serial}: no inventory row for {' '.join(group.values())}")
+    for file_name, row, columns in report.malformed:
+        values = ", ".join(f"{column}={row[column]!r}" for column in columns)
+        click.echo(f"{file_name}: serial {row.get('Serial') or '-'} has malformed {values}")
+    for serial, count in sorted(report.duplicates.items()):
+        click.echo(f"Serial {serial} is listed {count} times in {INDIVIDUAL_PHONES_FILE}")
+    click.echo(f"{report.rows} rows, {report.rows_checked} checked in {report.seconds * 1000:.1f} ms: "
+               f"{len(report.mismatches)} mismatched groups, {len(report.orphans)} orphan serials, "
+               f"{len(report.malformed)} malformed rows, {len(report.duplicates)} duplicate serials")
+    if fix and (report.mismatches or report.orphans or report.malformed or report.duplicates):
+        try:
+            fixed = checker.repair(report)
+        except StaleReport as e:
+            raise click.ClickException(str(e))
+        click.echo(f"Fixed {fixed['numbers']} malformed rows, removed {fixed['serials']} surplus or orphan serials "
+                   f"and {fixed['duplicates']} duplicate rows")
+        if app.config["WRITE_BEHIND"]:
+            shop.store.flush()
+        report = checker.check(incremental=True)
+        click.echo(f"Left: {len(report.mismatches)} mismatched groups, {len(report.orphans)} orphan serials, "
+                   f"{len(report.malformed)} malformed rows, {len(report.duplicates)} duplicate serials")
+
+@app.cli.command("sales-report")
+@click.option("--from", "start", help="First sale day (YYYY-MM-DD)")
+@click.option("--to", "end", help="Last sale day (YYYY-MM-DD)")
+@click.option("--by", multiple=True, type=click.Choice(DIMENSIONS), default=["brand"], show_default=True)
+def sales_report_command(start, end, by):
+    """Print units, revenue, profit and margin per group for a date range."""
+    prepare_data()
+    report = sales_report_for(parse_day(start), parse_day(end), by)
+    for group in report.groups + [dict(report.totals, Total="Total")]:
+        labels = " ".join(str(value) for name, value in group.items() if name[0].isupper())
+        margin = "-" if group["margin"] is None else f"{group['margin']}%"
+        click.echo(f"{labels:40} {group['units']:>8} units {group['revenue']:>14} revenue "
+                   f"{group['profit']:>14} profit {margin:>7}")
+    click.echo(f"{report.sales} sales in {report.seconds * 1000:.1f} ms")
+
+@app.cli.command("import-sqlite")
+def import_sqlite_command():
+    """Copy the CSV data files into the SQLite database (SQLITE_DB)."""
+    prepare_data()
+    shop = current_shop()
+    target = open_store("sqlite", db_path=shop.path(app.config["SQLITE_DB"]),
+                        unique_serials=[INDIVIDUAL_PHONES_FILE], record_types=RECORD_TYPES)
+    report = import_csv_files(CsvStore(shop.data_dir), target, DATA_FILES)
+    for file_name, (imported, skipped) in report.items():
+        click.echo(f"{file_name}: {imported} rows imported, {skipped} duplicate serials skipped")
+
+# A shop named like the first part of a route would hide that route behind its prefix
+hidden = set(shops) & {rule.rule.split("/")[1] for rule in app.url_map.iter_rules()}
+if hidden:
+    raise ValueError(f"Store names clash with routes: {', '.join(sorted(hidden))}")
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    create_app().run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,67 @@
+import csv
+import io
+import zlib
+
+from reports import parse_day
+
+
+# Bytes of CSV text collected before a chunk is sent
+CHUNK_SIZE = 64 * 1024
+
+
+def filter_rows(rows, brand="", start=None, end=None):
+    """Yield rows of one brand (case-insensitive) sold between two inclusive dates.
+
+    Date bounds apply to the Sale Date column; rows without a valid date
+    are left out once a bound is given.
+    """
+    brand = brand.strip().lower()
+    days = {}
+    for row in rows:
+        if brand and (row.get("Brand") or "").lower() != brand:
+            continue
+        if start or end:
+            text = row.get("Sale Date") or ""
+            if text not in days:
+                days[text] = parse_day(text)
+            day = days[text]
+            if day is None or (start and day < start) or (end and day > end):
+                continue
+        yield row
+
+
+def csv_chunks(rows, fieldnames, chunk_size=CHUNK_SIZE):
+    """Yield CSV text in chunks of about ``chunk_size``, starting with the header.
+
+    The header is a chunk of its own, sent before the first row is read, so
+    a client sees the download start even when a filter skips most rows.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fieldnames)
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    for row in rows:
+        writer.writerow([row.get(name, "") for name in fieldnames])
+        if buffer.tell() >= chunk_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def gzip_chunks(chunks, level=6):
+    """Compress text chunks into a gzip stream as they arrive.
+
+    The first chunk is flushed at once so the gzip header and the CSV
+    header leave before the rest is compressed.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for index, chunk in enumerate(chunks):
+        data = compressor.compress(chunk.encode("utf-8"))
+        if index == 0:
+            data += compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,140 @@
+import csv
+import io
+import time
+from collections import namedtuple
+from decimal import Decimal, InvalidOperation
+
+from records import typed
+from storage import FIELDNAMES, GROUP_KEY, INDIVIDUAL_FIELDNAMES, Batch
+
+
+# Columns a bulk upload may set; anything missing comes from the form defaults
+INTAKE_FIELDS = ["Brand", "Serial", "Model", "Box", "Charger", "Bought Price", "Sell Price", "Category", "Notes"]
+
+YES_VALUES = {"yes", "y", "true", "1", "x", "on"}
+
+IntakeReport = namedtuple("IntakeReport", "accepted rejected groups_updated groups_created seconds serials")
+
+
+def units_per_second(report):
+    return report.accepted / report.seconds if report.seconds else float(report.accepted)
+
+
+def parse_upload(text, defaults):
+    """Turn an uploaded CSV or a newline-separated barcode list into records.
+
+    A first line that names a Serial column is read as a CSV header;
+    otherwise every non-empty line is a scanned serial. Missing columns
+    are filled from ``defaults``. Yields (line number, record) pairs.
+    """
+    lines = text.lstrip("\ufeff").splitlines()
+    first = next((line for line in lines if line.strip()), "")
+    header = [name.strip() for name in next(csv.reader([first]), [])]
+
+    if "Serial" in header:
+        reader = csv.DictReader(io.StringIO("\n".join(lines)))
+        reader.fieldnames = [name.strip() for name in reader.fieldnames]
+        for line_no, row in enumerate(reader, start=2):
+            record = dict(defaults)
+            record.update({key: (value or "").strip() for key, value in row.items()
+                           if key in INTAKE_FIELDS and (value or "").strip()})
+            yield line_no, record
+    else:
+        for line_no, line in enumerate(lines, start=1):
+            serial = line.strip()
+            if serial:
+                yield line_no, dict(defaults, Serial=serial)
+
+
+def _normalize(record):
+    record = {name: (record.get(name) or "").strip() for name in INTAKE_FIELDS}
+    record["Model"] = record["Model"].upper()
+    record["Category"] = (record["Category"] or "available").lower()
+    for name in ("Box", "Charger"):
+        record[name] = "Yes" if record[name].lower() in YES_VALUES else "No"
+    return record
+
+
+def _invalid_price(value):
+    try:
+        return not Decimal(value).is_finite()
+    except (InvalidOperation, ValueError):
+        return True
+
+
+def plan_intake(records, existing_serials):
+    """Validate records and group them like add() does.
+
+    ``existing_serials`` is any container of serials that may not be added
+    again, such as the serial registry.
+
+    Returns (groups, phones, rejected): the new unit count per GROUP_KEY,
+    (line number, row) of the phones.csv rows to append and (line number,
+    serial, reason) for every rejected record.
+    """
+    groups = {}
+    phones = []
+    rejected = []
+    seen = set()
+    for line_no, record in records:
+        record = _normalize(record)
+        serial = record["Serial"]
+        if not serial:
+            rejected.append((line_no, serial, "missing serial"))
+        elif serial in existing_serials:
+            rejected.append((line_no, serial, "serial already registered"))
+        elif serial in seen:
+            rejected.append((line_no, serial, "serial repeated in this upload"))
+        elif not record["Brand"] or not record["Model"]:
+            rejected.append((line_no, serial, "missing brand or model"))
+        elif _invalid_price(record["Sell Price"]) or _invalid_price(record["Bought Price"] or "0"):
+            rejected.append((line_no, serial, "invalid price"))
+        else:
+            seen.add(serial)
+            phones.append((line_no, dict(record, Quantity="1")))
+            key = tuple(record[name] for name in GROUP_KEY)
+            if key not in groups:
+                groups[key] = dict(record, Serial="0", Quantity=0)
+            groups[key]["Quantity"] += 1
+    return groups, phones, rejected
+
+
+def import_stock(store, inventory_file, phones_file, records, existing_serials):
+    """Add a whole batch of units with one write per file; return an IntakeReport.
+
+    Existing inventory groups get their Quantity raised and new groups and
+    all individual phones are appended, in one Batch: each file is written
+    once and both change together. Units of a group whose current Quantity
+    cannot be read are rejected rather than guessed at.
+    """
+    started = time.perf_counter()
+    groups, phones, rejected = plan_intake(records, existing_serials)
+    updated = created = 0
+    with store.transaction():
+        batch = Batch()
+        unreadable = set()
+        for key, group in groups.items():
+            match = dict(zip(GROUP_KEY, key))
+            current = store.find(inventory_file, match)
+            if current is None:
+                batch.append(inventory_file, [dict(group, Quantity=str(group["Quantity"]))], FIELDNAMES)
+                created += 1
+                continue
+            quantity = typed(current, "Quantity")
+            if quantity is None:
+                unreadable.add(key)
+                continue
+            batch.update(inventory_file, match, {"Quantity": str(quantity + group["Quantity"])}, FIELDNAMES)
+            updated += 1
+        if unreadable:
+            for line_no, phone in phones:
+                if tuple(phone[name] for name in GROUP_KEY) in unreadable:
+                    rejected.append((line_no, phone["Serial"], "invalid quantity in the existing inventory group"))
+            phones = [(line_no, phone) for line_no, phone in phones
+                      if tuple(phone[name] for name in GROUP_KEY) not in unreadable]
+            rejected.sort(key=lambda item: item[0])
+        phones = [phone for _, phone in phones]
+        batch.append(phones_file, phones, INDIVIDUAL_FIELDNAMES)
+        store.apply(batch)
+    return IntakeReport(len(phones), rejected, updated, created, time.perf_counter() - started,
+                        [phone["Serial"] for phone in phones])
@@ -0,0 +1,317 @@
+import csv
+import hashlib
+import json
+import os
+import time
+from collections import Counter, namedtuple
+from decimal import Decimal, InvalidOperation
+
+from records import DECIMAL_COLUMNS, INT_COLUMNS, typed
+from registry import PLACEHOLDER_SERIAL
+from storage import GROUP_KEY, Batch, CsvStore, _snapshot_lines, file_stamp, write_text_atomic
+
+
+# Directory next to the data files with the counts of the last check, one
+# JSON file per data file
+STATE_DIR = ".integrity"
+
+NUMERIC_COLUMNS = INT_COLUMNS | DECIMAL_COLUMNS
+
+# Bytes before the last read offset that must be unchanged for a file to
+# count as only appended to
+TAIL_BYTES = 256
+
+# Hex digits of the digest kept per row
+DIGEST_CHARS = 12
+
+Mismatch = namedtuple("Mismatch", "group quantity expected surplus")
+Malformed = namedtuple("Malformed", "file_name row columns")
+IntegrityReport = namedtuple("IntegrityReport",
+                             "rows rows_checked mismatches orphans malformed duplicates seconds versions")
+
+
+class StaleReport(Exception):
+    """Raised by repair() when the data changed after the report was made."""
+
+
+def _digest(values):
+    return hashlib.blake2b("\x1f".join(values).encode("utf-8"), digest_size=DIGEST_CHARS // 2).hexdigest()
+
+
+def _tail(f, offset):
+    f.seek(max(offset - TAIL_BYTES, 0))
+    return hashlib.blake2b(f.read(min(offset, TAIL_BYTES)), digest_size=8).hexdigest()
+
+
+def clean_number(text, column):
+    """The canonical text of a malformed number, or None when it cannot be read unambiguously.
+
+    Surrounding spaces and thousands separators are dropped ("1,500 " ->
+    "1500") and whole decimals become integers in integer columns.
+    """
+    cleaned = (text or "").strip().replace(",", "").replace(" ", "")
+    try:
+        value = Decimal(cleaned)
+    except InvalidOperation:
+        return None
+    if not value.is_finite() or value < 0:
+        return None
+    if column in INT_COLUMNS:
+        if value != value.to_integral_value():
+            return None
+        return str(int(value))
+    return cleaned
+
+
+class IntegrityChecker:
+    """Reconciles inventory group Quantities with the serials in phones.csv.
+
+    One pass over the data files builds hash-keyed counts per group
+    (GROUP_KEY): distinct serials received in phones.csv, units that left
+    through the sold, services and finished lists, and the Quantity of the
+    group's inventory rows. Quantity should equal received minus left.
+    When it is lower, the surplus is units removed with delete(), which
+    leaves their serials behind; in-stock serials of a group that has no
+    inventory row left are orphans. Numeric columns that do not parse are
+    malformed, and a serial listed twice in phones.csv is a duplicate.
+
+    The counts of every file are saved in ``state_dir`` with a digest of
+    each row. An incremental check skips unchanged files, reads only the
+    bytes appended to a file since the last run, and re-reads a rewritten
+    file for its counts while checking only rows whose digest is new.
+
+    ``files`` maps the list names "phones", "sold", "inventory",
+    "finished" and "services" to file names, and ``data_files`` maps
+    those to their columns.
+    """
+
+    def __init__(self, store, files, data_files, state_dir=STATE_DIR, registry=None):
+        self.store = store
+        self.files = files
+        self.data_files = data_files
+        self.state_dir = state_dir
+        self.registry = registry
+
+    # --- scanning ---
+    def _state_path(self, name):
+        return os.path.join(self.state_dir, name + ".json")
+
+    def _load_state(self, name):
+        try:
+            with open(self._state_path(name), encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    @staticmethod
+    def _blank(header):
+        return {"header": header, "digests": "", "units": {}, "serials": {}, "unreadable": [], "malformed": {}}
+
+    def _count(self, name, state, header, reader, known):
+        """Add the rows from ``reader`` to the counts in ``state``; return how many were checked.
+
+        Rows whose digest is in ``known`` were checked by an earlier run
+        and keep their malformed entry from ``known``.
+        """
+        units, serials, malformed = state["units"], state["serials"], state["malformed"]
+        unreadable = set(state["unreadable"])
+        digests = []
+        checked = 0
+        for values in reader:
+            if not values:
+                continue
+            digest = _digest(values)
+            digests.append(digest)
+            row = dict(zip(header, values))
+            for column in header[len(values):]:
+                row[column] = ""
+            key = "\x1f".join(row.get(column, "") for column in GROUP_KEY)
+            quantity = typed(row, "Quantity")
+            if name == "inventory":
+                units[key] = units.get(key, 0) + (quantity or 0)
+                if quantity is None:
+                    unreadable.add(key)
+            else:
+                units[key] = units.get(key, 0) + (quantity if quantity and quantity > 0 else 1)
+            serial = row.get("Serial", "")
+            if serial and serial != PLACEHOLDER_SERIAL:
+                serials.setdefault(key, []).append(serial)
+            if digest in known:
+                if known[digest]:
+                    malformed[digest] = known[digest]
+                continue
+            checked += 1
+            bad = sorted(column for column in NUMERIC_COLUMNS
+                         if (row.get(column) or "").strip() and (typed(row, column) is None or typed(row, column) < 0))
+            if bad:
+                malformed[digest] = [bad, row]
+        state["digests"] += "".join(digests)
+        state["unreadable"] = sorted(unreadable)
+        return checked
+
+    def _snapshot(self, name):
+        """What _scan() reads of one file: an open file and its stat, rows, or None if missing.
+
+        Taken while writers are held off, so all files are seen at one point
+        in time; the scan itself reads only the bytes the stat covers.
+        """
+        file_name = self.files[name]
+        if not isinstance(self.store, CsvStore):
+            return self.store.rows(file_name, list(self.data_files[file_name]))
+        try:
+            f = open(self.store.path(file_name), "rb")
+        except FileNotFoundError:
+            return None
+        return f, os.fstat(f.fileno())
+
+    def _scan(self, name, old, snapshot):
+        """Return the new state of one file and how many of its rows were checked (None if unchanged)."""
+        file_name = self.files[name]
+        fieldnames = list(self.data_files[file_name])
+        known = {}
+        if old:
+            digests = old["digests"]
+            known = dict.fromkeys(digests[i:i + DIGEST_CHARS] for i in range(0, len(digests), DIGEST_CHARS))
+            known.update(old["malformed"])
+        if not isinstance(self.store, CsvStore):
+            state = self._blank(fieldnames)
+            reader = ([row.get(name, "") for name in fieldnames] for row in snapshot)
+            return state, self._count(name, state, fieldnames, reader, known)
+        if snapshot is None:
+            return self._blank(fieldnames), 0
+        f, st = snapshot
+        with f:
+            stamp = list(file_stamp(st))
+            if old and old.get("stamp") == stamp:
+                return old, None
+            offset = old.get("offset", 0) if old else 0
+            if (old and old.get("stamp") and old["stamp"][0] == st.st_ino and st.st_size >= offset
+                    and old.get("tail") == _tail(f, offset)):
+                # Only appended to since the last run: count the new bytes
+                state, header, known = old, old["header"], {}
+                f.seek(offset)
+                reader = csv.reader(_snapshot_lines(f, st.st_size - offset))
+            else:
+                f.seek(0)
+                reader = csv.reader(_snapshot_lines(f, st.st_size))
+                header = [name.lstrip("\ufeff") for name in next(reader, fieldnames)]
+                state = self._blank(header)
+            checked = self._count(name, state, header, reader, known)
+            state.update(stamp=stamp, offset=st.st_size, tail=_tail(f, st.st_size))
+        return state, checked
+
+    def check(self, incremental=False):
+        """Scan the data files and return an IntegrityReport.
+
+        Without ``incremental`` every row is checked again; either way the
+        counts are saved for the next incremental run. The store's write
+        lock is held only while every file is opened, not during the scan.
+        """
+        started = time.perf_counter()
+        os.makedirs(self.state_dir, exist_ok=True)
+        snapshots = {}
+        versions = {}
+        files = {}
+        checked = 0
+        try:
+            with self.store.transaction():
+                for name, file_name in self.files.items():
+                    snapshots[name] = self._snapshot(name)
+                    versions[file_name] = self.store.version(file_name, self.data_files[file_name])
+            for name in self.files:
+                files[name], count = self._scan(name, self._load_state(name) if incremental else None,
+                                                snapshots.pop(name))
+                if count is not None:
+                    checked += count
+                    write_text_atomic(self._state_path(name), json.dumps(files[name], separators=(",", ":")))
+        finally:
+            if isinstance(self.store, CsvStore):
+                for snapshot in snapshots.values():
+                    if snapshot is not None:
+                        snapshot[0].close()
+        return self._report(files, checked, time.perf_counter() - started, versions)
+
+    # --- reconciling ---
+    def _report(self, files, checked, seconds, versions):
+        placed = set()
+        left = Counter()
+        for name in ("sold", "services", "finished"):
+            left.update(files[name]["units"])
+            for serials in files[name]["serials"].values():
+                placed.update(serials)
+        inventory = files["inventory"]
+        quantities = inventory["units"]
+        unreadable = set(inventory["unreadable"])
+        for serials in inventory["serials"].values():
+            placed.update(serials)
+
+        copies = Counter()
+        mismatches, orphans = [], []
+        for key, serials in files["phones"]["serials"].items():
+            copies.update(serials)
+            # dict keys keep the serials in file order, oldest first
+            serials = dict.fromkeys(serials)
+            expected = len(serials) - left[key]
+            if key not in quantities:
+                if expected <= 0:
+                    continue
+                group = dict(zip(GROUP_KEY, key.split("\x1f")))
+                in_stock = [serial for serial in serials if serial not in placed]
+                orphans.extend((serial, group) for serial in in_stock[-expected:])
+            elif quantities[key] != expected and key not in unreadable:
+                group = dict(zip(GROUP_KEY, key.split("\x1f")))
+                surplus = expected - quantities[key]
+                in_stock = [serial for serial in serials if serial not in placed] if surplus > 0 else []
+                mismatches.append(Mismatch(group, quantities[key], expected, in_stock[-surplus:] if surplus > 0 else []))
+
+        malformed = [Malformed(self.files[name], row, columns)
+                     for name, state in files.items() for columns, row in state["malformed"].values()]
+        duplicates = {serial: count for serial, count in copies.items() if count > 1}
+        rows = sum(len(state["digests"]) // DIGEST_CHARS for state in files.values())
+        return IntegrityReport(rows, checked, mismatches, orphans, malformed, duplicates, seconds, versions)
+
+    def repair(self, report):
+        """Fix what the report shows unambiguously, in one batch; return counts per kind of fix.
+
+        Malformed numbers that clean_number() can read are rewritten,
+        surplus and orphan serials are removed from phones.csv (and
+        forgotten by the registry), and repeated serials keep their first
+        row. Groups holding more units than serials are left alone: there
+        is no serial to add. Groups with a malformed Quantity are only
+        reconciled once it is readable, on the next check.
+
+        Raises StaleReport, changing nothing, when any file was written
+        after the report's check opened it.
+        """
+        batch = Batch()
+        fixed = Counter()
+        for file_name, row, columns in report.malformed:
+            changes = {column: clean_number(row[column], column) for column in columns}
+            if None not in changes.values():
+                batch.update(file_name, row, changes, self.data_files[file_name])
+                fixed["numbers"] += 1
+        phones_file = self.files["phones"]
+        phone_fields = self.data_files[phones_file]
+        removed = dict.fromkeys([serial for mismatch in report.mismatches for serial in mismatch.surplus]
+                                + [serial for serial, _ in report.orphans])
+        for serial in removed:
+            for _ in range(report.duplicates.get(serial, 1)):
+                batch.remove(phones_file, {"Serial": serial}, phone_fields)
+        fixed["serials"] = len(removed)
+        with self.store.transaction():
+            changed = [file_name for file_name, version in report.versions.items()
+                       if self.store.version(file_name, self.data_files[file_name]) != version]
+            if changed:
+                raise StaleReport(f"{', '.join(changed)} changed since the check; check again before repairing")
+            copies = {}
+            for row in self.store.rows(phones_file, phone_fields):
+                if row["Serial"] in report.duplicates and row["Serial"] not in removed:
+                    copies.setdefault(row["Serial"], []).append(row)
+            for rows in copies.values():
+                for row in rows[1:]:
+                    batch.remove(phones_file, dict(row), phone_fields)
+                    fixed["duplicates"] += 1
+            self.store.apply(batch)
+            if self.registry is not None:
+                self.registry.record((serial, None) for serial in removed)
+        return fixed
@@ -0,0 +1,177 @@
+import json
+import os
+import threading
+from decimal import Decimal, InvalidOperation
+
+from records import typed
+from storage import file_stamp, write_text_atomic
+
+
+COUNTERS = ("revenue", "cost", "profit", "units")
+
+
+def to_decimal(value):
+    """Parse a price column exactly; empty or invalid prices count as 0."""
+    try:
+        number = Decimal(str(value).strip())
+    except (InvalidOperation, ValueError):
+        return Decimal(0)
+    return number if number.is_finite() else Decimal(0)
+
+
+def _empty():
+    return {name: Decimal(0) for name in COUNTERS}
+
+
+def _add(counters, revenue, cost):
+    counters["revenue"] += revenue
+    counters["cost"] += cost
+    counters["profit"] += revenue - cost
+    counters["units"] += 1
+
+
+class SalesLedger:
+    """Running revenue, cost and profit totals kept up to date on every sale.
+
+    Counters are exact Decimals, kept for the whole store and per sale
+    day, brand and model. They live in a small JSON file and are updated
+    together with sold_phones.csv, so reading a total never re-reads the
+    sales history. rebuild() recomputes everything from the sold rows.
+
+    A ``deferred`` ledger only counts new sales in memory; flush() writes
+    them (the write-behind store calls it after writing the data files).
+    """
+
+    def __init__(self, file_path="sales_ledger.json", deferred=False):
+        self.file_path = file_path
+        self.deferred = deferred
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._data = self._blank()
+        self._dirty = False
+
+    @staticmethod
+    def _blank():
+        return {"total": _empty(), "by_day": {}, "by_brand": {}, "by_model": {}}
+
+    def _refresh(self):
+        """Re-read the ledger file if another worker changed it."""
+        if self._dirty:
+            return
+        try:
+            stamp = file_stamp(os.stat(self.file_path))
+        except FileNotFoundError:
+            self._stamp, self._data = None, self._blank()
+            return
+        if stamp == self._stamp:
+            return
+        with open(self.file_path, encoding="utf-8") as f:
+            raw = json.load(f)
+        data = self._blank()
+        data["total"] = {name: Decimal(raw["total"][name]) for name in COUNTERS}
+        for section in ("by_day", "by_brand", "by_model"):
+            for key, counters in raw.get(section, {}).items():
+                data[section][key] = {name: Decimal(counters[name]) for name in COUNTERS}
+        self._stamp, self._data = stamp, data
+
+    def _save(self):
+        raw = {"total": {name: str(value) for name, value in self._data["total"].items()}}
+        for section in ("by_day", "by_brand", "by_model"):
+            raw[section] = {key: {name: str(value) for name, value in counters.items()}
+                            for key, counters in self._data[section].items()}
+        write_text_atomic(self.file_path, json.dumps(raw, indent=1, sort_keys=True))
+        self._stamp = file_stamp(os.stat(self.file_path))
+        self._dirty = False
+
+    @staticmethod
+    def model_key(brand, model):
+        return f"{brand} {model}"
+
+    def _apply(self, data, sold_phones):
+        for phone in sold_phones:
+            revenue = typed(phone, "Sell Price") or Decimal(0)
+            cost = typed(phone, "Bought Price") or Decimal(0)
+            keys = (
+                ("by_day", phone.get("Sale Date", "")),
+                ("by_brand", phone.get("Brand", "")),
+                ("by_model", self.model_key(phone.get("Brand", ""), phone.get("Model", ""))),
+            )
+            _add(data["total"], revenue, cost)
+            for section, key in keys:
+                _add(data[section].setdefault(key, _empty()), revenue, cost)
+
+    def record_sales(self, sold_phones):
+        """Add newly sold rows to the counters and persist them.
+
+        Call this inside the store transaction that appends the rows to
+        sold_phones.csv so concurrent workers do not overwrite each other.
+        """
+        with self._lock:
+            self._refresh()
+            self._apply(self._data, sold_phones)
+            if self.deferred:
+                self._dirty = True
+            else:
+                self._save()
+
+    def flush(self):
+        """Write counters a deferred ledger only holds in memory; True if there were any."""
+        with self._lock:
+            if not self._dirty:
+                return False
+            self._save()
+            return True
+
+    def rebuild(self, sold_phones):
+        """Recompute every counter from the sold rows.
+
+        Returns the differences from the stored counters as
+        {section: {key: {counter: stored - rebuilt}}}; empty when nothing drifted.
+        """
+        rebuilt = self._blank()
+        self._apply(rebuilt, sold_phones)
+        with self._lock:
+            self._dirty = False
+            self._refresh()
+            drift = self._diff(self._data, rebuilt)
+            self._data = rebuilt
+            self._save()
+        return drift
+
+    @staticmethod
+    def _diff(stored, rebuilt):
+        drift = {}
+        sections = {"total": {"": stored["total"]}}
+        expected = {"total": {"": rebuilt["total"]}}
+        for section in ("by_day", "by_brand", "by_model"):
+            sections[section] = stored[section]
+            expected[section] = rebuilt[section]
+        for section, counters_by_key in sections.items():
+            for key in set(counters_by_key) | set(expected[section]):
+                old = counters_by_key.get(key, _empty())
+                new = expected[section].get(key, _empty())
+                delta = {name: old[name] - new[name] for name in COUNTERS if old[name] != new[name]}
+                if delta:
+                    drift.setdefault(section, {})[key] = delta
+        return drift
+
+    # --- O(1) queries ---
+    def total(self):
+        with self._lock:
+            self._refresh()
+            return dict(self._data["total"])
+
+    def day(self, date):
+        with self._lock:
+            self._refresh()
+            return dict(self._data["by_day"].get(date, _empty()))
+
+    def brand(self, brand):
+        with self._lock:
+            self._refresh()
+            return dict(self._data["by_brand"].get(brand, _empty()))
+
+    def model(self, brand, model):
+        with self._lock:
+            self._refresh()
+            return dict(self._data["by_model"].get(self.model_key(brand, model), _empty()))
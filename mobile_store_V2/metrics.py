@@ -0,0 +1,173 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from flask import Response, before_render_template, g, has_request_context, request, template_rendered
+
+
+# Upper bounds (seconds) of the request latency histogram
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PHASES = ("storage_read", "storage_write", "render")
+
+logger = logging.getLogger("mobile_store.slow_requests")
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _StoreObserver:
+    """The observer of one store: passes its parses and writes on under the store's name."""
+
+    def __init__(self, metrics, store_name):
+        self.metrics = metrics
+        self.store_name = store_name
+
+    def read(self, file_name, rows, seconds):
+        self.metrics.read(file_name, rows, seconds, store=self.store_name)
+
+    def write(self, file_name, rows, size, seconds):
+        self.metrics.write(file_name, rows, size, seconds, store=self.store_name)
+
+
+class StoreMetrics:
+    """Opt-in request timings and storage I/O counters for the /metrics endpoint.
+
+    Installed as the observer of each store, it is told about every file
+    parse and write, counted per store and file. Inside a request those are added to the request's
+    storage-read and storage-write time; template rendering is timed
+    through Flask's render signals. When a request ends its latency goes
+    into a per-endpoint histogram, and requests slower than ``slow_ms`` are
+    logged with their phase breakdown and the files they touched.
+
+    Nothing is registered unless init_app() is called, so a disabled app
+    pays only for the store's ``observer`` check on actual file I/O.
+    """
+
+    def __init__(self, slow_ms=500):
+        self.slow_ms = slow_ms
+        self._lock = threading.Lock()
+        self._requests = defaultdict(lambda: [0] * (len(BUCKETS) + 1))
+        self._request_sums = defaultdict(float)
+        self._phases = defaultdict(float)
+        self._files = defaultdict(lambda: {"reads": 0, "rows_read": 0, "read_seconds": 0.0, "writes": 0,
+                                           "rows_written": 0, "bytes_written": 0, "write_seconds": 0.0})
+        self.slow_requests = 0
+
+    def init_app(self, app, stores):
+        """Register the request hooks and /metrics, and observe {store name: store}."""
+        for store_name, store in stores.items():
+            store.observer = _StoreObserver(self, store_name)
+        app.before_request(self._start)
+        app.teardown_request(self._finish)
+        before_render_template.connect(self._render_started, app)
+        template_rendered.connect(self._render_finished, app)
+        app.add_url_rule("/metrics", "metrics", self.render)
+
+    # --- store observer ---
+    def read(self, file_name, rows, seconds, store=""):
+        with self._lock:
+            counters = self._files[store, file_name]
+            counters["reads"] += 1
+            counters["rows_read"] += rows
+            counters["read_seconds"] += seconds
+        self._record("storage_read", file_name, seconds, rows=rows)
+
+    def write(self, file_name, rows, size, seconds, store=""):
+        with self._lock:
+            counters = self._files[store, file_name]
+            counters["writes"] += 1
+            counters["rows_written"] += rows
+            counters["bytes_written"] += size or 0
+            counters["write_seconds"] += seconds
+        self._record("storage_write", file_name, seconds, rows=rows, size=size or 0)
+
+    def _record(self, phase, file_name, seconds, rows=0, size=0):
+        current = g.get("_metrics") if has_request_context() else None
+        if current is None:
+            return
+        current["phases"][phase] += seconds
+        touched = current["files"][file_name]
+        touched[phase] += rows
+        touched["bytes"] += size
+
+    # --- request hooks ---
+    def _start(self):
+        g._metrics = {"started": time.perf_counter(), "phases": dict.fromkeys(PHASES, 0.0),
+                      "files": defaultdict(lambda: {"storage_read": 0, "storage_write": 0, "bytes": 0})}
+
+    def _render_started(self, sender, template, context, **extra):
+        current = g.get("_metrics")
+        if current is not None:
+            current["render_started"] = time.perf_counter()
+
+    def _render_finished(self, sender, template, context, **extra):
+        current = g.get("_metrics")
+        if current is not None and "render_started" in current:
+            current["phases"]["render"] += time.perf_counter() - current.pop("render_started")
+
+    def _finish(self, error=None):
+        current = g.pop("_metrics", None)
+        if current is None:
+            return
+        elapsed = time.perf_counter() - current["started"]
+        endpoint = request.endpoint or "unknown"
+        bucket = next((i for i, bound in enumerate(BUCKETS) if elapsed <= bound), len(BUCKETS))
+        with self._lock:
+            self._requests[endpoint][bucket] += 1
+            self._request_sums[endpoint] += elapsed
+            for phase, seconds in current["phases"].items():
+                self._phases[endpoint, phase] += seconds
+            slow = self.slow_ms is not None and elapsed * 1000 >= self.slow_ms
+            if slow:
+                self.slow_requests += 1
+        if slow:
+            phases = ", ".join(f"{phase} {seconds * 1000:.1f} ms" for phase, seconds in current["phases"].items())
+            files = "; ".join(f"{name}: {counts['storage_read']} rows read, {counts['storage_write']} rows "
+                              f"written, {counts['bytes']} bytes" for name, counts in current["files"].items())
+            logger.warning("Slow request %s %s took %.1f ms (%s)%s", request.method, request.path,
+                           elapsed * 1000, phases, f" [{files}]" if files else "")
+
+    # --- exposition ---
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            lines += ["# HELP store_request_seconds Request latency by endpoint.",
+                      "# TYPE store_request_seconds histogram"]
+            for endpoint, counts in sorted(self._requests.items()):
+                label = f'endpoint="{_label(endpoint)}"'
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ("+Inf",), counts):
+                    cumulative += count
+                    lines.append(f'store_request_seconds_bucket{{{label},le="{bound}"}} {cumulative}')
+                lines.append(f"store_request_seconds_sum{{{label}}} {self._request_sums[endpoint]:.6f}")
+                lines.append(f"store_request_seconds_count{{{label}}} {cumulative}")
+
+            lines += ["# HELP store_request_phase_seconds_total Time spent per request phase.",
+                      "# TYPE store_request_phase_seconds_total counter"]
+            for (endpoint, phase), seconds in sorted(self._phases.items()):
+                lines.append(f'store_request_phase_seconds_total{{endpoint="{_label(endpoint)}",'
+                             f'phase="{phase}"}} {seconds:.6f}')
+
+            for name, kind, help_text in (
+                    ("reads", "counter", "Files parsed from storage."),
+                    ("rows_read", "counter", "Rows parsed from storage."),
+                    ("read_seconds", "counter", "Time spent parsing files."),
+                    ("writes", "counter", "Writes to storage."),
+                    ("rows_written", "counter", "Rows written to storage."),
+                    ("bytes_written", "counter", "Bytes written to CSV files."),
+                    ("write_seconds", "counter", "Time spent writing files.")):
+                metric = f"store_file_{name}_total"
+                lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}"]
+                for (store, file_name), counters in sorted(self._files.items()):
+                    value = counters[name]
+                    value = f"{value:.6f}" if isinstance(value, float) else value
+                    lines.append(f'{metric}{{store="{_label(store)}",file="{_label(file_name)}"}} {value}')
+
+            lines += ["# HELP store_slow_requests_total Requests slower than the slow request threshold.",
+                      "# TYPE store_slow_requests_total counter",
+                      f"store_slow_requests_total {self.slow_requests}"]
+        return Response("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,81 @@
+from collections import namedtuple
+
+from records import typed
+from storage import FIELDNAMES, Batch
+
+
+# The way a phone normally goes through the shop, by list name:
+# available -> service -> finished -> available again, or available -> sold
+TRANSITIONS = {
+    ("inventory", "services"),
+    ("services", "finished"),
+    ("finished", "inventory"),
+    ("inventory", "sold"),
+}
+
+Move = namedtuple("Move", "row moved")
+
+
+class InvalidMove(ValueError):
+    """Raised for a move that is not one of the TRANSITIONS."""
+
+
+class MoveEngine:
+    """Moves phones between the lists of the shop as single store batches.
+
+    A move reads its source row from the store's cache and hands every
+    change to store.apply() as one Batch, so each affected file is written
+    once and a crash in the middle never duplicates or loses a phone (see
+    CsvStore.apply for the journal). The new location of every moved
+    serial is recorded in the serial registry when one is given.
+    """
+
+    def __init__(self, store, files, registry=None, fieldnames=FIELDNAMES):
+        self.store = store
+        self.files = files
+        self.registry = registry
+        self.fieldnames = fieldnames
+
+    def move(self, source, target, match, changes=None, units=None, check=True):
+        """Move the first row of list ``source`` matching ``match`` to list ``target``.
+
+        Without ``units`` the whole row moves with ``changes`` applied. With
+        ``units``, a list of changes per unit, only that many units of a
+        grouped row move: its Quantity drops by their number (the row is
+        removed when none are left) and one Quantity 1 copy per unit is
+        appended to the target. ``check=False`` allows moves outside
+        TRANSITIONS, such as manual corrections.
+
+        Returns a Move of the source row and the appended rows, or None when
+        no row matches.
+        """
+        if check and (source, target) not in TRANSITIONS:
+            raise InvalidMove(f"Cannot move a phone from {source} to {target}")
+        source_file, target_file = self.files[source], self.files[target]
+        with self.store.transaction():
+            row = self.store.find(source_file, match, self.fieldnames)
+            if row is None:
+                return None
+            batch = Batch()
+            if units is None:
+                moved = [row.copy()]
+                moved[0].update(changes or {})
+                batch.remove(source_file, match, self.fieldnames)
+            else:
+                remaining = (typed(row, "Quantity") or 0) - len(units)
+                if remaining > 0:
+                    batch.update(source_file, match, {"Quantity": str(remaining)}, self.fieldnames)
+                else:
+                    batch.remove(source_file, match, self.fieldnames)
+                moved = []
+                for unit in units:
+                    copy = row.copy()
+                    copy.update(changes or {})
+                    copy["Quantity"] = "1"
+                    copy.update(unit)
+                    moved.append(copy)
+            batch.append(target_file, moved, self.fieldnames)
+            self.store.apply(batch)
+            if self.registry is not None:
+                self.registry.record((phone["Serial"], target) for phone in moved)
+        return Move(row, moved)
@@ -0,0 +1,140 @@
+import math
+import threading
+from collections import namedtuple
+
+from ledger import to_decimal
+from records import typed
+
+
+DEFAULT_PER_PAGE = 50
+MAX_PER_PAGE = 500
+
+# Columns compared as numbers when sorting or filtering
+NUMERIC_COLUMNS = {"Quantity", "Bought Price", "Sell Price", "Service Price"}
+
+Page = namedtuple("Page", "items number per_page total pages")
+
+
+class RowsMemo:
+    """Remembers values computed from one version of a file's rows.
+
+    The store hands out the same rows tuple until the file changes, so a
+    value is reused for as long as it was computed from that exact tuple.
+    Up to ``ways`` versions are kept per key, the most recent first, so
+    several stores serving the same file names do not evict each other.
+    """
+
+    def __init__(self, ways=1):
+        self.ways = ways
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, rows, compute):
+        with self._lock:
+            entries = self._entries.get(key, ())
+        for entry in entries:
+            if entry[0] is rows:
+                return entry[1]
+        value = compute()
+        with self._lock:
+            entries = [entry for entry in self._entries.get(key, ()) if entry[0] is not rows]
+            self._entries[key] = [(rows, value)] + entries[:self.ways - 1]
+        return value
+
+
+memo = RowsMemo()
+
+
+def quantity_total(rows):
+    return sum(typed(row, "Quantity") or 0 for row in rows)
+
+
+def memo_quantity_total(name, rows):
+    """Sum of the Quantity column, computed once per version of the rows."""
+    return memo.get(("quantity", name), rows, lambda: quantity_total(rows))
+
+
+def _sort_key(column):
+    if column in NUMERIC_COLUMNS:
+        return lambda row: typed(row, column) or 0
+    return lambda row: (row.get(column) or "").lower()
+
+
+def read_options(args, columns, default_sort=None):
+    """Read paging, sorting and filter options from request args."""
+    try:
+        number = max(int(args.get("page", 1)), 1)
+    except ValueError:
+        number = 1
+    try:
+        per_page = min(max(int(args.get("per_page", DEFAULT_PER_PAGE)), 1), MAX_PER_PAGE)
+    except ValueError:
+        per_page = DEFAULT_PER_PAGE
+    sort = args.get("sort", default_sort)
+    if sort not in columns:
+        sort = default_sort
+    return {
+        "page": number,
+        "per_page": per_page,
+        "sort": sort,
+        "descending": args.get("order") == "desc",
+        "brand": args.get("brand", "").strip().lower(),
+        "model": args.get("model", "").strip().lower(),
+        "category": args.get("category", "").strip().lower(),
+        "min_price": to_decimal(args["min_price"]) if args.get("min_price") else None,
+        "max_price": to_decimal(args["max_price"]) if args.get("max_price") else None,
+    }
+
+
+def has_filters(options):
+    return any(options[name] not in ("", None) for name in
+               ("brand", "model", "category", "min_price", "max_price"))
+
+
+def filter_rows(rows, options, price_column="Sell Price"):
+    """Yield the rows that match the brand/model/category/price filters."""
+    brand, model, category = options["brand"], options["model"], options["category"]
+    min_price, max_price = options["min_price"], options["max_price"]
+    for row in rows:
+        if brand and (row.get("Brand") or "").lower() != brand:
+            continue
+        if model and model not in (row.get("Model") or "").lower():
+            continue
+        if category and (row.get("Category") or "").lower() != category:
+            continue
+        if min_price is not None or max_price is not None:
+            price = typed(row, price_column) or 0
+            if min_price is not None and price < min_price:
+                continue
+            if max_price is not None and price > max_price:
+                continue
+        yield row
+
+
+def page_of(name, rows, options, price_column="Sell Price"):
+    """Return (page, quantity total) for one view of a file's rows.
+
+    Only the requested page is turned into a list for rendering. Unfiltered
+    views reuse the memoized sort order and quantity total of the rows;
+    filtered views compute both in a single pass over the matches. Pass
+    ``name=None`` for rows that are not a stable cached tuple.
+    """
+    if has_filters(options) or name is None:
+        matches = list(filter_rows(rows, options, price_column))
+        total_quantity = quantity_total(matches)
+        if options["sort"]:
+            matches.sort(key=_sort_key(options["sort"]), reverse=options["descending"])
+    else:
+        matches = rows
+        total_quantity = memo_quantity_total(name, rows)
+        if options["sort"]:
+            sort, descending = options["sort"], options["descending"]
+            matches = memo.get(("sorted", name, sort, descending), rows,
+                               lambda: tuple(sorted(rows, key=_sort_key(sort), reverse=descending)))
+
+    per_page = options["per_page"]
+    pages = max(math.ceil(len(matches) / per_page), 1)
+    number = min(options["page"], pages)
+    start = (number - 1) * per_page
+    items = list(matches[start:start + per_page])
+    return Page(items, number, per_page, len(matches), pages), total_quantity
@@ -0,0 +1,232 @@
+from collections.abc import Mapping
+from operator import attrgetter
+from decimal import Decimal, InvalidOperation
+
+from storage import FIELDNAMES, INDIVIDUAL_FIELDNAMES
+
+
+# Numeric columns and the type they are parsed to once, at load time
+INT_COLUMNS = {"Quantity"}
+DECIMAL_COLUMNS = {"Bought Price", "Sell Price", "Service Price"}
+
+# Text columns whose values are (nearly) unique, so not worth sharing
+UNIQUE_COLUMNS = {"Serial"}
+
+
+def attribute_name(column):
+    """The attribute a column is stored in: "Sell Price" -> sell_price."""
+    return column.lower().replace(" ", "_")
+
+
+def _parse_int(text):
+    return int(text)
+
+
+def _parse_decimal(text):
+    value = Decimal(text)
+    if not value.is_finite():
+        raise ValueError(text)
+    return value
+
+
+def _converter(column):
+    if column in INT_COLUMNS:
+        return _parse_int
+    if column in DECIMAL_COLUMNS:
+        return _parse_decimal
+    return None
+
+
+class Record(Mapping):
+    """One CSV row with its columns in slots instead of a dict.
+
+    Quantity is stored as an int and prices as Decimals, parsed once when
+    the row is loaded; empty or invalid numbers are None. Read them as
+    attributes (``row.quantity``, ``row.sell_price``). Item access works
+    like the csv.DictReader dicts it replaces: ``row["Sell Price"]``,
+    ``get()``, ``items()`` and ``dict(row)`` return the column text exactly
+    as it was read, so a record is written back to the same CSV columns.
+    Subclasses set ``columns``; their slots are created from it.
+    """
+
+    __slots__ = ("_raw",)
+    columns = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._attributes = {column: attribute_name(column) for column in cls.columns}
+        cls._plan = [(column, attribute_name(column), _converter(column)) for column in cls.columns]
+        cls._values = attrgetter(*cls._attributes.values()) if len(cls.columns) > 1 else None
+
+    def __init__(self, values=(), **changes):
+        self._raw = None
+        for _, attribute, convert in self._plan:
+            setattr(self, attribute, "" if convert is None else None)
+        self.update(values, **changes)
+
+    @classmethod
+    def parser(cls, header):
+        """Return a function turning one sequence of values in ``header`` order into a record.
+
+        Equal texts and numbers parsed by one parser share a single object,
+        so repeated brands, prices and dates cost one pointer per row.
+        """
+        plan = [(position, column, attribute, convert, column not in UNIQUE_COLUMNS)
+                for position, name in enumerate(header)
+                for column, attribute, convert in cls._plan if column == name]
+        missing = [(attribute, "" if convert is None else None)
+                   for column, attribute, convert in cls._plan if column not in header]
+        texts, numbers = {}, {}
+        new = cls.__new__
+
+        def parse(values):
+            record = new(cls)
+            record._raw = None
+            for attribute, default in missing:
+                setattr(record, attribute, default)
+            for position, column, attribute, convert, share in plan:
+                text = values[position] if position < len(values) else ""
+                if convert is None:
+                    setattr(record, attribute, texts.setdefault(text, text) if share else text)
+                elif not text:
+                    setattr(record, attribute, None)
+                else:
+                    number = numbers.get((column, text))
+                    if number is None:
+                        record._set_number(column, attribute, convert, text)
+                        if not record._raw or column not in record._raw:
+                            numbers[column, text] = getattr(record, attribute)
+                    else:
+                        setattr(record, attribute, number)
+            return record
+        return parse
+
+    def _set_number(self, column, attribute, convert, text):
+        try:
+            value = convert(text)
+        except (ValueError, InvalidOperation):
+            value = None
+        setattr(self, attribute, value)
+        # Keep the original text of numbers that would not read back the same
+        if value is None or str(value) != text:
+            if self._raw is None:
+                self._raw = {}
+            self._raw[column] = text
+        elif self._raw:
+            self._raw.pop(column, None)
+
+    def typed(self, column):
+        """The parsed value of a column (int, Decimal or str; None if invalid)."""
+        return getattr(self, self._attributes[column])
+
+    # --- mapping interface, in CSV text ---
+    def __getitem__(self, column):
+        attribute = self._attributes[column]
+        if self._raw and column in self._raw:
+            return self._raw[column]
+        value = getattr(self, attribute)
+        return value if type(value) is str else ("" if value is None else str(value))
+
+    def __setitem__(self, column, value):
+        attribute = self._attributes[column]
+        text = "" if value is None else str(value)
+        convert = _converter(column)
+        if self._raw:
+            self._raw.pop(column, None)
+        if convert is None:
+            setattr(self, attribute, text)
+        elif not text:
+            setattr(self, attribute, None)
+        else:
+            self._set_number(column, attribute, convert, text)
+
+    def get(self, column, default=None):
+        attribute = self._attributes.get(column)
+        if attribute is None:
+            return default
+        if self._raw and column in self._raw:
+            return self._raw[column]
+        value = getattr(self, attribute)
+        return value if type(value) is str else ("" if value is None else str(value))
+
+    def __contains__(self, column):
+        return column in self._attributes
+
+    def __iter__(self):
+        return iter(self.columns)
+
+    def __len__(self):
+        return len(self.columns)
+
+    def update(self, values=(), **changes):
+        items = values.items() if hasattr(values, "items") else values
+        for column, value in items:
+            self[column] = value
+        for column, value in changes.items():
+            self[column] = value
+
+    def csv_row(self):
+        """Column values in ``columns`` order, ready for csv.writer (None writes as "")."""
+        values = self._values(self)
+        if self._raw:
+            values = list(values)
+            for position, column in enumerate(self.columns):
+                if column in self._raw:
+                    values[position] = self._raw[column]
+        return values
+
+    def copy(self):
+        record = self.__class__.__new__(self.__class__)
+        for attribute, value in zip(self._attributes.values(), self._values(self)):
+            setattr(record, attribute, value)
+        record._raw = dict(self._raw) if self._raw else None
+        return record
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({dict(self)!r})"
+
+
+class StoreRecord(Record):
+    """A row with the full set of FIELDNAMES columns."""
+
+    columns = tuple(FIELDNAMES)
+    __slots__ = tuple(attribute_name(column) for column in FIELDNAMES)
+
+
+class InventoryGroup(StoreRecord):
+    """A grouped inventory.csv row: one model/box/charger/price with its Quantity."""
+
+    __slots__ = ()
+
+
+class SoldUnit(StoreRecord):
+    """One sold phone in sold_phones.csv."""
+
+    __slots__ = ()
+
+
+class ServiceJob(StoreRecord):
+    """A phone in services.csv or finished.csv."""
+
+    __slots__ = ()
+
+
+class Phone(Record):
+    """One individual phone (serial) in phones.csv."""
+
+    columns = tuple(INDIVIDUAL_FIELDNAMES)
+    __slots__ = tuple(attribute_name(column) for column in INDIVIDUAL_FIELDNAMES)
+
+
+def typed(row, column):
+    """The parsed value of a numeric column for records and plain dicts alike."""
+    if isinstance(row, Record):
+        return row.typed(column) if column in row else None
+    text = (row.get(column) or "").strip()
+    convert = _converter(column)
+    if not text or convert is None:
+        return text or None
+    try:
+        return convert(text)
+    except (ValueError, InvalidOperation):
+        return None
@@ -0,0 +1,171 @@
+import csv
+import io
+import os
+import threading
+
+from storage import write_text_atomic
+
+
+# Serial of the grouped inventory rows; it names no single phone
+PLACEHOLDER_SERIAL = "0"
+
+# Location of phones that left the shop; they may come back for service
+SOLD = "sold"
+
+
+def _parse(data):
+    """(serial, location) pairs of complete log lines in ``data``."""
+    for values in csv.reader(io.StringIO(data.decode("utf-8"))):
+        if values:
+            yield values[0], values[1] if len(values) > 1 else ""
+
+
+class SerialRegistry:
+    """Serial -> the list a phone currently lives in, in one dict lookup.
+
+    Every move is appended to a small CSV log of "serial,location" lines
+    (an empty location removes the serial) and the last line for a serial
+    wins, so recording a move costs one short append instead of a rewrite.
+    Other workers' appends are picked up by reading only the bytes added
+    since the last read; the log is compacted once it has grown to about
+    twice the number of live serials. rebuild() replaces it from the data
+    files.
+
+    Rows themselves are not stored: positions shift on every rewrite, and
+    the store's per-version hash index finds a row by serial once its file
+    is known.
+    """
+
+    def __init__(self, file_path="serials.log"):
+        self.file_path = file_path
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self, inode=None):
+        self._locations = {}
+        self._inode = inode
+        self._first = None
+        self._offset = 0
+        self._lines = 0
+
+    def _apply(self, entries):
+        locations = self._locations
+        for serial, location in entries:
+            if location:
+                locations[serial] = location
+            else:
+                locations.pop(serial, None)
+            self._lines += 1
+
+    def _refresh(self):
+        """Read the log lines other workers appended since the last read."""
+        try:
+            st = os.stat(self.file_path)
+        except FileNotFoundError:
+            self._reset()
+            return
+        if st.st_ino != self._inode or st.st_size < self._offset:
+            self._reset(st.st_ino)
+        if st.st_size == self._offset:
+            return
+        with open(self.file_path, "rb") as f:
+            first = f.readline()
+            if self._offset and first != self._first:
+                # Compacted into a new file that happens to reuse the inode
+                self._reset(st.st_ino)
+            self._first = first
+            if self._offset == 0 and first.startswith(b"#") and first.endswith(b"\n"):
+                self._offset = len(first)
+            f.seek(self._offset)
+            data = f.read(st.st_size - self._offset)
+        # A line still being written by another worker is read next time
+        data = data[:data.rfind(b"\n") + 1]
+        self._apply(_parse(data))
+        self._offset += len(data)
+
+    def _compact(self):
+        buffer = io.StringIO()
+        # A fresh first line tells other workers the log was replaced
+        buffer.write(f"# {os.urandom(8).hex()}\n")
+        csv.writer(buffer, lineterminator="\n").writerows(sorted(self._locations.items()))
+        write_text_atomic(self.file_path, buffer.getvalue())
+        st = os.stat(self.file_path)
+        self._inode, self._offset, self._lines = st.st_ino, st.st_size, len(self._locations)
+        self._first = buffer.getvalue().partition("\n")[0].encode("utf-8") + b"\n"
+
+    def record(self, moves):
+        """Persist (serial, location) moves; a location of None forgets the serial.
+
+        Empty and placeholder serials are ignored. Call this inside the
+        store transaction that moves the rows so workers do not interleave.
+        """
+        moves = [(serial, location or "") for serial, location in moves
+                 if serial and serial != PLACEHOLDER_SERIAL]
+        if not moves:
+            return
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator="\n").writerows(moves)
+        payload = buffer.getvalue().encode("utf-8")
+        with self._lock:
+            self._refresh()
+            fd = os.open(self.file_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, payload)
+                os.fsync(fd)
+                st = os.fstat(fd)
+            finally:
+                os.close(fd)
+            self._apply(moves)
+            if self._first is None:
+                self._first = payload[:payload.find(b"\n") + 1]
+            self._inode, self._offset = st.st_ino, st.st_size
+            if self._lines > 2 * len(self._locations) + 1000:
+                self._compact()
+
+    def rebuild(self, locations):
+        """Replace the registry with serials found in the data files.
+
+        ``locations`` maps each location to the serials found there, in
+        rising precedence: a serial listed in several locations is
+        registered in the last one. Returns (drift, conflicts): drift maps
+        serials whose stored location differed to (stored, rebuilt), and
+        conflicts maps serials found in more than one location other than
+        SOLD to those locations.
+        """
+        rebuilt = {}
+        found = {}
+        for location, serials in locations.items():
+            for serial in serials:
+                if serial and serial != PLACEHOLDER_SERIAL:
+                    rebuilt[serial] = location
+                    if location != SOLD:
+                        found.setdefault(serial, []).append(location)
+        conflicts = {serial: places for serial, places in found.items() if len(places) > 1}
+        with self._lock:
+            self._refresh()
+            stored = self._locations
+            drift = {serial: (stored.get(serial), rebuilt.get(serial))
+                     for serial in set(stored) | set(rebuilt) if stored.get(serial) != rebuilt.get(serial)}
+            self._locations = rebuilt
+            self._compact()
+        return drift, conflicts
+
+    # --- O(1) queries ---
+    def locate(self, serial):
+        """The location of a serial, or None when it is not registered."""
+        with self._lock:
+            self._refresh()
+            return self._locations.get(serial)
+
+    def __contains__(self, serial):
+        """True for every registered serial, sold ones included."""
+        return self.locate(serial) is not None
+
+    def in_shop(self, serial):
+        """True while a phone is in the shop: in stock, in service or finished."""
+        return self.locate(serial) not in (None, SOLD)
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return len(self._locations)
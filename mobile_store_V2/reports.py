@@ -0,0 +1,231 @@
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+from datetime import date
+from decimal import Decimal
+
+try:
+    import numpy
+except ImportError:  # Pure-Python aggregation works too, just slower
+    numpy = None
+
+from ledger import to_decimal
+from storage import appended_rows
+
+
+# Columns a report can be grouped by, in display order
+DIMENSIONS = ("brand", "model", "day", "month")
+
+DAY_SECONDS = 86400
+
+COLUMNS = ("when", "day", "month", "brand", "model", "revenue", "cost")
+
+Report = namedtuple("Report", "groups totals sales seconds")
+
+
+def parse_day(value):
+    """A report bound from a YYYY-MM-DD string; None when empty or invalid."""
+    try:
+        return date.fromisoformat((value or "").strip())
+    except ValueError:
+        return None
+
+
+def _cents(value):
+    try:
+        return int(value) * 100
+    except (TypeError, ValueError):
+        return int(to_decimal(value).scaleb(2).to_integral_value())
+
+
+def _money(cents):
+    return Decimal(int(cents)).scaleb(-2)
+
+
+def _seconds(value):
+    try:
+        hours, minutes, seconds = value.split(":")
+        return int(hours) * 3600 + int(minutes) * 60 + int(float(seconds))
+    except (AttributeError, ValueError):
+        return 0
+
+
+class SalesReport:
+    """sold_phones.csv as typed columns, ready for date-range group-bys.
+
+    Every sale becomes one entry in parallel int64 arrays: sale time
+    (seconds since day 0, so the columns stay sorted by it), day, month,
+    brand and model codes, and revenue and cost in cents. A date range is
+    found by binary search and aggregated with NumPy when it is installed,
+    or in a single pure-Python pass otherwise. Sales the store only
+    appended are parsed on their own; any other change reloads the
+    columns. Rows without a valid Sale Date are left out.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rows = None
+        self._reset()
+
+    def _reset(self):
+        self.columns = {name: array("q") for name in COLUMNS}
+        self.brands, self.models = [], []
+        self._brand_codes, self._model_codes = {}, {}
+        self._days, self._times, self._prices = {}, {}, {}
+        self.skipped = 0
+
+    def _code(self, codes, labels, key):
+        code = codes.get(key)
+        if code is None:
+            code = codes[key] = len(labels)
+            labels.append(key)
+        return code
+
+    def _day(self, value):
+        parsed = self._days.get(value)
+        if parsed is None:
+            day = parse_day(value)
+            parsed = self._days[value] = (day.toordinal(), day.year * 12 + day.month - 1) if day else ()
+        return parsed
+
+    def _time(self, value):
+        seconds = self._times.get(value)
+        if seconds is None:
+            seconds = self._times[value] = _seconds(value)
+        return seconds
+
+    def _price(self, value):
+        cents = self._prices.get(value)
+        if cents is None:
+            cents = self._prices[value] = _cents(value)
+        return cents
+
+    def _parse(self, rows):
+        """Column lists for rows, sorted by sale time."""
+        parsed = {name: [] for name in COLUMNS}
+        when, days, months = parsed["when"], parsed["day"], parsed["month"]
+        brands, models, revenue, cost = parsed["brand"], parsed["model"], parsed["revenue"], parsed["cost"]
+        for row in rows:
+            day = self._day(row.get("Sale Date"))
+            if not day:
+                self.skipped += 1
+                continue
+            brand = row.get("Brand") or ""
+            when.append(day[0] * DAY_SECONDS + self._time(row.get("Sale Time")))
+            days.append(day[0])
+            months.append(day[1])
+            brands.append(self._code(self._brand_codes, self.brands, brand))
+            models.append(self._code(self._model_codes, self.models, (brand, row.get("Model") or "")))
+            revenue.append(self._price(row.get("Sell Price")))
+            cost.append(self._price(row.get("Bought Price")))
+        # Sales are normally appended in time order; sort the rare exceptions
+        if any(later < earlier for earlier, later in zip(when, when[1:])):
+            order = sorted(range(len(when)), key=when.__getitem__)
+            parsed = {name: [column[i] for i in order] for name, column in parsed.items()}
+        return parsed
+
+    def _load(self, rows):
+        self._reset()
+        for name, column in self._parse(rows).items():
+            self.columns[name].extend(column)
+
+    def refresh(self, rows):
+        """Bring the columns up to date with the current sold rows tuple."""
+        with self._lock:
+            old = self._rows
+            if old is rows:
+                return
+            appended = appended_rows(old, rows)
+            if appended is not None:
+                parsed = self._parse(appended)
+                when = self.columns["when"]
+                if not parsed["when"] or not when or parsed["when"][0] >= when[-1]:
+                    for name, column in parsed.items():
+                        self.columns[name].extend(column)
+                else:
+                    self._load(rows)
+            else:
+                self._load(rows)
+            self._rows = rows
+
+    def _range(self, start, end):
+        when = self.columns["when"]
+        low = bisect_left(when, start.toordinal() * DAY_SECONDS) if start else 0
+        high = bisect_left(when, (end.toordinal() + 1) * DAY_SECONDS) if end else len(when)
+        return low, max(low, high)
+
+    def _aggregate(self, by, low, high):
+        """{group codes: [units, revenue cents, cost cents]} for one slice."""
+        columns = self.columns
+        if numpy is not None and high > low:
+            view = lambda name: numpy.frombuffer(columns[name], dtype=numpy.int64)[low:high]
+            codes = numpy.stack([view(name) for name in by], axis=1)
+            keys, inverse = numpy.unique(codes, axis=0, return_inverse=True)
+            inverse = inverse.reshape(-1)
+            units = numpy.bincount(inverse)
+            # Float sums of whole cents stay exact far beyond any shop's turnover
+            revenue = numpy.bincount(inverse, weights=view("revenue"))
+            cost = numpy.bincount(inverse, weights=view("cost"))
+            return {tuple(int(code) for code in key): [int(units[i]), round(revenue[i]), round(cost[i])]
+                    for i, key in enumerate(keys)}
+
+        totals = {}
+        keys = zip(*(columns[name][low:high] for name in by))
+        for key, revenue, cost in zip(keys, columns["revenue"][low:high], columns["cost"][low:high]):
+            entry = totals.get(key)
+            if entry is None:
+                totals[key] = [1, revenue, cost]
+            else:
+                entry[0] += 1
+                entry[1] += revenue
+                entry[2] += cost
+        return totals
+
+    def _labels(self, name, code):
+        if name == "brand":
+            return {"Brand": self.brands[code]}
+        if name == "model":
+            brand, model = self.models[code]
+            return {"Brand": brand, "Model": model}
+        if name == "day":
+            return {"Day": date.fromordinal(code).isoformat()}
+        return {"Month": f"{code // 12:04d}-{code % 12 + 1:02d}"}
+
+    @staticmethod
+    def _figures(units, revenue, cost):
+        profit = revenue - cost
+        return {
+            "units": units,
+            "revenue": _money(revenue),
+            "cost": _money(cost),
+            "profit": _money(profit),
+            "margin": round(Decimal(profit) * 100 / revenue, 1) if revenue else None,
+        }
+
+    def summary(self, start=None, end=None, by=("brand",)):
+        """Units, revenue, cost, profit and margin % per group between two dates.
+
+        ``start`` and ``end`` are inclusive dates (None for open ends), ``by``
+        any combination of DIMENSIONS. Returns a Report whose groups are
+        dicts of group labels plus figures, sorted by label.
+        """
+        started = time.perf_counter()
+        by = [name for name in DIMENSIONS if name in by]
+        if "model" in by and "brand" in by:
+            by.remove("brand")
+        with self._lock:
+            low, high = self._range(start, end)
+            totals = self._aggregate(by, low, high) if by else {}
+            groups = []
+            for key, (units, revenue, cost) in totals.items():
+                group = {}
+                for name, code in zip(by, key):
+                    group.update(self._labels(name, code))
+                group.update(self._figures(units, revenue, cost))
+                groups.append(group)
+            revenue = sum(self.columns["revenue"][low:high])
+            cost = sum(self.columns["cost"][low:high])
+        groups.sort(key=lambda group: tuple(str(group.get(column, "")) for column in ("Month", "Day", "Brand", "Model")))
+        return Report(groups, self._figures(high - low, revenue, cost), high - low, time.perf_counter() - started)
@@ -0,0 +1,138 @@
+import threading
+from collections import defaultdict
+
+from storage import appended_rows
+
+
+# Columns that are searchable, per source
+SEARCH_FIELDS = ("Brand", "Model", "Serial", "Notes")
+
+# Tokens shorter than this are matched by prefix, longer ones by n-grams
+GRAM = 3
+
+# Candidate count above which limited queries stop intersecting posting lists
+PROBE_THRESHOLD = 4096
+
+
+def _tokens(row):
+    text = " ".join((row.get(field) or "") for field in SEARCH_FIELDS).lower()
+    return set(text.split())
+
+
+def _keys(tokens):
+    """Posting keys of a document: token prefixes up to GRAM-1 chars plus all n-grams."""
+    keys = set()
+    for token in tokens:
+        for size in range(1, min(len(token), GRAM - 1) + 1):
+            keys.add("^" + token[:size])
+        for start in range(len(token) - GRAM + 1):
+            keys.add(token[start:start + GRAM])
+    return keys
+
+
+def _query_keys(term):
+    if len(term) < GRAM:
+        return {"^" + term}
+    return {term[start:start + GRAM] for start in range(len(term) - GRAM + 1)}
+
+
+def _row_key(row):
+    return tuple(row.items())
+
+
+class SearchIndex:
+    """In-memory prefix/n-gram index over several row sources.
+
+    Every token of Brand, Model, Serial and Notes is indexed by its first
+    one or two characters and by all of its trigrams. A query term shorter
+    than three characters matches token prefixes ("a1" finds A16); longer
+    terms match anywhere inside a token ("3233" finds a serial fragment).
+
+    refresh() takes the current rows of each source and updates the index
+    incrementally: rows the store only appended (see
+    storage.appended_rows) are indexed on their own, and after a rewrite only rows that actually changed are removed
+    or added.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings = defaultdict(set)
+        self._docs = {}
+        self._by_key = {}
+        self._sources = {}
+        self._next_id = 0
+
+    def _add(self, source, row):
+        doc_id = self._next_id
+        self._next_id += 1
+        self._docs[doc_id] = (source, row, _tokens(row))
+        self._by_key[source].setdefault(_row_key(row), []).append(doc_id)
+        for key in _keys(self._docs[doc_id][2]):
+            self._postings[key].add(doc_id)
+
+    def _remove(self, source, row_key):
+        doc_id = self._by_key[source][row_key].pop()
+        if not self._by_key[source][row_key]:
+            del self._by_key[source][row_key]
+        _, _, tokens = self._docs.pop(doc_id)
+        for key in _keys(tokens):
+            postings = self._postings[key]
+            postings.discard(doc_id)
+            if not postings:
+                del self._postings[key]
+
+    def refresh(self, sources):
+        """Bring the index up to date with {source name: rows tuple}."""
+        with self._lock:
+            for source, rows in sources.items():
+                old = self._sources.get(source)
+                if old is rows:
+                    continue
+                self._by_key.setdefault(source, {})
+                appended = appended_rows(old, rows)
+                if appended is not None:
+                    for row in appended:
+                        self._add(source, row)
+                else:
+                    wanted = defaultdict(int)
+                    for row in rows:
+                        wanted[_row_key(row)] += 1
+                    for row_key, doc_ids in list(self._by_key[source].items()):
+                        for _ in range(len(doc_ids) - wanted.get(row_key, 0)):
+                            self._remove(source, row_key)
+                    for row in rows:
+                        row_key = _row_key(row)
+                        have = len(self._by_key[source].get(row_key, ()))
+                        if have < wanted[row_key]:
+                            self._add(source, row)
+                self._sources[source] = rows
+
+    def search(self, query, sources=None, limit=None):
+        """Return (source, row) pairs whose tokens match every query term."""
+        terms = query.lower().split()
+        if not terms:
+            return []
+        with self._lock:
+            keys = set()
+            for term in terms:
+                keys |= _query_keys(term)
+            postings = sorted((self._postings.get(key, set()) for key in keys), key=len)
+            # Intersect from the smallest posting list up; once a limited
+            # query still has many candidates, probe the remaining lists
+            # lazily so it can stop as soon as enough rows matched
+            candidates, others = postings[0], postings[1:]
+            while others and not (limit and len(candidates) > PROBE_THRESHOLD):
+                candidates = candidates & others.pop(0)
+            matches = []
+            for doc_id in candidates:
+                if others and not all(doc_id in other for other in others):
+                    continue
+                source, row, tokens = self._docs[doc_id]
+                if sources is not None and source not in sources:
+                    continue
+                if all(any(token.startswith(term) if len(term) < GRAM else term in token
+                           for token in tokens) for term in terms):
+                    matches.append(doc_id)
+                    if limit and len(matches) >= limit:
+                        break
+            return [self._docs[doc_id][:2] for doc_id in sorted(matches)]
@@ -0,0 +1,70 @@
+from concurrent.futures import ThreadPoolExecutor
+
+
+# WSGI environ keys naming the shop a request was addressed to and the
+# SCRIPT_NAME it arrived with, before any shop prefix was moved into it
+ENVIRON_KEY = "mobile_store.shop"
+ROOT_KEY = "mobile_store.root"
+
+# Threads used at most to query every shop at once
+MAX_FAN_OUT = 8
+
+
+def parse_stores(text):
+    """{name: data directory} from "name=directory" items separated by commas."""
+    stores = {}
+    for item in text.split(","):
+        if not item.strip():
+            continue
+        name, sep, data_dir = (part.strip() for part in item.partition("="))
+        if not sep or not name or not data_dir or "/" in name or "." in name:
+            raise ValueError(f"Expected name=directory in STORES, got {item.strip()!r}")
+        if name in stores:
+            raise ValueError(f"Store {name!r} is listed twice in STORES")
+        stores[name] = data_dir
+    if not stores:
+        raise ValueError("STORES names no store")
+    return stores
+
+
+class ShopSelector:
+    """WSGI middleware reading the shop of a request from its URL prefix or subdomain.
+
+    "/north/inventory" is served as "/inventory" of shop "north", with the
+    prefix moved to SCRIPT_NAME so url_for() links and redirects stay
+    inside the shop; a host like "north.example.com" selects it as well.
+    The name is left in the environ under ENVIRON_KEY; requests naming no
+    known shop carry none. ROOT_KEY holds the path links to other shops
+    start from.
+    """
+
+    def __init__(self, wsgi_app, names):
+        self.wsgi_app = wsgi_app
+        self.names = set(names)
+
+    def __call__(self, environ, start_response):
+        environ[ROOT_KEY] = environ.get("SCRIPT_NAME", "").rstrip("/")
+        first, _, rest = environ.get("PATH_INFO", "").lstrip("/").partition("/")
+        if first in self.names:
+            environ[ENVIRON_KEY] = first
+            environ["SCRIPT_NAME"] = environ[ROOT_KEY] + "/" + first
+            environ["PATH_INFO"] = "/" + rest
+        else:
+            host = environ.get("HTTP_HOST", "").split(":")[0]
+            label = host.partition(".")[0]
+            if "." in host and label in self.names:
+                environ[ENVIRON_KEY] = label
+        return self.wsgi_app(environ, start_response)
+
+
+def fan_out(shops, call):
+    """{name: call(shop)} for every shop, computed in parallel threads.
+
+    Each shop has its own store and locks, so a busy shop only delays its
+    own entry. An exception from any shop is raised once all have finished.
+    """
+    if len(shops) == 1:
+        return {name: call(shop) for name, shop in shops.items()}
+    with ThreadPoolExecutor(max_workers=min(len(shops), MAX_FAN_OUT), thread_name_prefix="fan-out") as pool:
+        futures = {name: pool.submit(call, shop) for name, shop in shops.items()}
+    return {name: future.result() for name, future in futures.items()}
@@ -5,6 +5,34 @@ document.addEventListener('DOMContentLoaded', function () {
     const scannerDiv = document.getElementById('barcode-scanner');
     const closeScannerBtn = document.getElementById('close-scanner');
 
+    // The serial inputs below only exist on the add-phone form
+    if (!addForm) return;
+
+    // Suggest models already in stock for the selected brand
+    const brandSelect = document.getElementById('brand-select');
+    const modelOptions = document.getElementById('model-options');
+    let catalog = {};
+
+    function fillModelOptions() {
+        modelOptions.innerHTML = '';
+        (catalog[brandSelect.value] || []).forEach(function (model) {
+            const option = document.createElement('option');
+            option.value = model;
+            modelOptions.appendChild(option);
+        });
+    }
+
+    if (brandSelect && modelOptions) {
+        fetch(brandSelect.dataset.catalogUrl)
+            .then(response => response.json())
+            .then(data => {
+                catalog = data;
+                fillModelOptions();
+            })
+            .catch(err => console.error(err));
+        brandSelect.addEventListener('change', fillModelOptions);
+    }
+
     let isScanning = false;
     let currentScanningInput = null;
 
@@ -96,4 +124,54 @@ document.addEventListener('DOMContentLoaded', function () {
     closeScannerBtn.addEventListener('click', stopScanner);
     quantityInput.addEventListener('input', generateSerialInputs);
     quantityInput.addEventListener('change', generateSerialInputs);
-});
\ No newline at end of file
+});
+
+// As-you-type search on the sells page, backed by /api/search
+document.addEventListener('DOMContentLoaded', function () {
+    const searchInput = document.getElementById('sells-search');
+    const suggestions = document.getElementById('search-suggestions');
+    if (!searchInput || !suggestions) return;
+
+    let debounceTimer = null;
+    let lastQuery = '';
+
+    function clearSuggestions() {
+        suggestions.innerHTML = '';
+    }
+
+    function showSuggestions(results) {
+        clearSuggestions();
+        results.forEach(function (phone) {
+            const item = document.createElement('a');
+            item.className = 'list-group-item list-group-item-action';
+            item.href = phone.url;
+            const label = phone.source === 'phones' ? `Serial ${phone.Serial}` : `${phone.Quantity} in stock`;
+            item.textContent = `${phone.Brand} ${phone.Model} · ${label}`;
+            suggestions.appendChild(item);
+        });
+    }
+
+    searchInput.addEventListener('input', function () {
+        const query = searchInput.value.trim();
+        clearTimeout(debounceTimer);
+        if (!query) {
+            lastQuery = '';
+            clearSuggestions();
+            return;
+        }
+        debounceTimer = setTimeout(function () {
+            lastQuery = query;
+            fetch(`${searchInput.dataset.searchUrl}?q=${encodeURIComponent(query)}&limit=10`)
+                .then(response => response.json())
+                .then(data => {
+                    // Ignore answers to queries the user has already typed past
+                    if (data.query === lastQuery) showSuggestions(data.results);
+                })
+                .catch(err => console.error(err));
+        }, 150);
+    });
+
+    document.addEventListener('click', function (event) {
+        if (event.target !== searchInput) clearSuggestions();
+    });
+});
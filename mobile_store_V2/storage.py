@@ -0,0 +1,1009 @@
+import csv
+import io
+import itertools
+import json
+import logging
+import os
+import sqlite3
+import stat
+import tempfile
+import threading
+import time
+from collections.abc import Sequence
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: only threads of one process are serialized
+    fcntl = None
+
+
+# --- Global Fieldnames ---
+FIELDNAMES = ["Brand", "Serial", "Model", "Box", "Charger",
+              "Bought Price", "Sell Price", "Category", "Notes", "Quantity",
+              "Customer Name", "Customer Number", "Sale Date", "Sale Time", "Service Price"]
+
+
+INDIVIDUAL_FIELDNAMES = ["Brand", "Serial", "Model", "Box", "Charger", "Bought Price", "Sell Price", "Category", "Notes", "Quantity"]
+
+# Columns that identify one grouped inventory row
+GROUP_KEY = ("Brand", "Model", "Box", "Charger", "Sell Price")
+
+# Lock file that serializes writers across worker processes
+LOCK_FILE = ".store.lock"
+
+# Renames and appends of a batch that is being applied (see CsvStore.apply)
+JOURNAL_FILE = ".store.journal"
+
+# Prefix of the new file versions a batch prepares before its journal exists
+BATCH_PREFIX = ".batch-"
+
+logger = logging.getLogger("mobile_store.storage")
+
+# Generations of cached rows; shared by every store so they never repeat
+_generations = itertools.count(1)
+
+
+class Rows(Sequence):
+    """The cached rows of a file: a read-only sequence tagged with its generation.
+
+    Rows that only extend an earlier version by appends keep its generation
+    (see extended()); any other change starts a new one. Consumers that
+    keep state derived from the rows use appended_rows() to tell the two
+    cases apart.
+
+    Versions of one generation share a single list, each seeing its first
+    ``len()`` items, so an append adds only the new rows instead of copying
+    the file's rows. Slices are returned as tuples.
+    """
+
+    __slots__ = ("_items", "_length", "generation")
+
+    def __init__(self, rows=(), generation=None, _items=None):
+        self._items = list(rows) if _items is None else _items
+        self._length = len(self._items)
+        self.generation = next(_generations) if generation is None else generation
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return tuple(self._items[slice(*index.indices(self._length))])
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("Rows index out of range")
+        return self._items[index]
+
+    def __iter__(self):
+        return itertools.islice(self._items, self._length)
+
+    def __repr__(self):
+        return f"Rows({self[:]!r}, generation={self.generation})"
+
+    def extended(self, rows):
+        """These rows followed by ``rows``, in the same generation.
+
+        The shared list grows in place when these are its newest rows; an
+        older version extended again gets a list of its own. Only writers
+        extend rows, inside a transaction, so two extensions never race.
+        """
+        items = self._items
+        if len(items) != self._length:
+            items = items[:self._length]
+        items.extend(rows)
+        return Rows(generation=self.generation, _items=items)
+
+
+def appended_rows(old, rows):
+    """The rows appended to ``old`` to give ``rows``, or None if ``rows`` changed otherwise.
+
+    ``old`` may be None for rows seen for the first time.
+    """
+    if old is rows:
+        return ()
+    if (old is None or getattr(old, "generation", None) is None
+            or getattr(rows, "generation", None) != old.generation or len(rows) < len(old)):
+        return None
+    return rows[len(old):]
+
+
+def _normalize(row, fieldnames):
+    """Return a row exactly as it reads back after being written to a CSV file."""
+    return {name: "" if row.get(name) is None else str(row.get(name)) for name in fieldnames}
+
+
+def _normalizer(fieldnames, record_type=None):
+    """Return a function that normalizes rows into dicts, or into ``record_type`` records."""
+    if record_type is None or tuple(fieldnames) != record_type.columns:
+        return lambda row: _normalize(row, fieldnames)
+
+    def normalize(row):
+        if type(row) is record_type:
+            return row.copy()
+        return record_type(_normalize(row, fieldnames))
+    return normalize
+
+
+def _read_rows(f, record_type=None):
+    """Parse an open CSV file into dicts, or into ``record_type`` records."""
+    if record_type is None:
+        return Rows(csv.DictReader(f))
+    reader = csv.reader(f)
+    parse = record_type.parser(next(reader, []))
+    return Rows(parse(values) for values in reader if values)
+
+
+def _snapshot_lines(f, size):
+    """Decoded lines of a binary file, up to the first ``size`` bytes."""
+    read = 0
+    for line in f:
+        read += len(line)
+        if read > size:
+            break
+        yield line.decode("utf-8")
+
+
+def _write_rows(f, rows, fieldnames):
+    fieldnames = tuple(fieldnames)
+    csv.writer(f).writerows(row.csv_row() if getattr(row, "columns", None) == fieldnames
+                            else [row[name] for name in fieldnames] for row in rows)
+
+
+def file_stamp(st):
+    """Identify one version of a file on disk."""
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def _read_header(file_path):
+    """Return the header row of a CSV file and whether the file ends with a newline."""
+    with open(file_path, "rb") as f:
+        first_line = f.readline().decode("utf-8-sig")
+        f.seek(0, os.SEEK_END)
+        if f.tell() == 0:
+            return [], True
+        f.seek(-1, os.SEEK_END)
+        ends_with_newline = f.read(1) in (b"\n", b"\r")
+    header = next(csv.reader([first_line]), [])
+    return header, ends_with_newline
+
+
+def _append_payload(file_path, rows, fieldnames):
+    """CSV text of rows to append to a file, or None when its header differs."""
+    header, ends_with_newline = _read_header(file_path)
+    if header != list(fieldnames):
+        return None
+    buffer = io.StringIO()
+    if not ends_with_newline:
+        buffer.write("\r\n")
+    _write_rows(buffer, rows, fieldnames)
+    return buffer.getvalue()
+
+
+def _append_to(file_path, rows, fieldnames):
+    """Append rows to an existing CSV file; return (new stamp, bytes written).
+
+    Readers see either none or all of the new rows: they are written with
+    a single O_APPEND write and fsynced. Returns None without writing when
+    the file's header does not match ``fieldnames``.
+    """
+    payload = _append_payload(file_path, rows, fieldnames)
+    if payload is None:
+        return None
+    payload = payload.encode("utf-8")
+    fd = os.open(file_path, os.O_WRONLY | os.O_APPEND)
+    try:
+        os.write(fd, payload)
+        os.fsync(fd)
+        stamp = file_stamp(os.fstat(fd))
+    finally:
+        os.close(fd)
+    return stamp, len(payload)
+
+
+def _fsync_dir(dir_path):
+    try:
+        fd = os.open(dir_path or ".", os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def _temp_file(file_path, prefix):
+    """Open a new temporary sibling of ``file_path``, fsynced when the block ends.
+
+    Yields the open text file; it is deleted again if the block fails.
+    """
+    dir_path = os.path.dirname(file_path)
+    fd, tmp_path = tempfile.mkstemp(dir=dir_path or ".", prefix=prefix + os.path.basename(file_path) + ".")
+    try:
+        try:
+            os.chmod(tmp_path, stat.S_IMODE(os.stat(file_path).st_mode))
+        except FileNotFoundError:
+            os.chmod(tmp_path, 0o644)
+        with open(fd, "w", newline="", encoding="utf-8") as f:
+            f.path = tmp_path
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+            f.stamp = file_stamp(os.fstat(f.fileno()))
+    except BaseException:
+        _unlink(tmp_path)
+        raise
+
+
+def _unlink(file_path):
+    try:
+        os.unlink(file_path)
+    except FileNotFoundError:
+        pass
+
+
+@contextmanager
+def atomic_open(file_path):
+    """Open a temporary file that replaces ``file_path`` once the block succeeds.
+
+    The data is fsynced before the rename, so after a crash the file holds
+    either the old or the new contents, never a mix. Yields the open text
+    file; its stamp after writing is available as ``f.stamp``.
+    """
+    with _temp_file(file_path, ".") as f:
+        yield f
+    try:
+        os.replace(f.path, file_path)
+    except BaseException:
+        _unlink(f.path)
+        raise
+    _fsync_dir(os.path.dirname(file_path))
+
+
+def write_text_atomic(file_path, text):
+    """Replace a small text file atomically."""
+    with atomic_open(file_path) as f:
+        f.write(text)
+
+
+class Batch:
+    """Row changes to several files that store.apply() writes as one unit.
+
+    Updates and removals of a file apply in the order they were added, each
+    to the first matching row still there; appended rows go to the end.
+    """
+
+    def __init__(self):
+        self.files = {}
+
+    def _changes(self, file_name, fieldnames):
+        return self.files.setdefault(file_name, {"fieldnames": fieldnames, "changes": [], "appends": []})
+
+    def update(self, file_name, match, changes, fieldnames=FIELDNAMES):
+        self._changes(file_name, fieldnames)["changes"].append((match, changes))
+
+    def remove(self, file_name, match, fieldnames=FIELDNAMES):
+        self._changes(file_name, fieldnames)["changes"].append((match, None))
+
+    def append(self, file_name, rows, fieldnames=FIELDNAMES):
+        self._changes(file_name, fieldnames)["appends"].extend(rows)
+
+
+class CsvStore:
+    """Keeps parsed CSV files in memory and only re-reads a file when it changed.
+
+    A cached file is re-parsed when its inode, mtime or size differs from the
+    version that was parsed last. Writes done through the store refresh the
+    cache directly, so the next read does not parse the file again.
+
+    Files are replaced atomically, and every write runs under a lock that
+    is held across threads and, through LOCK_FILE, across processes, so
+    several workers can share one data directory.
+
+    An ``observer`` (see metrics.StoreMetrics) is told about every parse
+    and write with its row count, bytes written and duration.
+
+    ``record_types`` maps file names to records.Record classes; those files
+    are parsed into typed records instead of dicts.
+    """
+
+    def __init__(self, data_dir=".", record_types=None):
+        self.data_dir = data_dir
+        self.record_types = record_types or {}
+        self._cache = {}
+        self._indexes = {}
+        self._cache_lock = threading.Lock()
+        self._parsing = {}
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._lock_file = None
+        self.observer = None
+
+    @contextmanager
+    def transaction(self):
+        """Run a read-modify-write sequence without other writers in between."""
+        with self._lock:
+            if self._depth == 0:
+                self._lock_file = open(self.path(LOCK_FILE), "a")
+                if fcntl:
+                    fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+            self._depth += 1
+            try:
+                if self._depth == 1 and os.path.exists(self.path(JOURNAL_FILE)):
+                    self._finish_batch()
+                yield self
+            finally:
+                self._depth -= 1
+                if self._depth == 0:
+                    if fcntl:
+                        fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+                    self._lock_file.close()
+                    self._lock_file = None
+
+    def path(self, file_name):
+        return os.path.join(self.data_dir, file_name)
+
+    def ensure(self, file_name, fieldnames=FIELDNAMES):
+        """Create an empty CSV file with a header row if it does not exist."""
+        if not os.path.exists(self.path(file_name)):
+            self.save(file_name, [], fieldnames)
+
+    def version(self, file_name, fieldnames=FIELDNAMES):
+        """A token that changes whenever the rows of a file change, read without parsing it."""
+        try:
+            return "%x-%x-%x" % file_stamp(os.stat(self.path(file_name)))
+        except FileNotFoundError:
+            return "0"
+
+    def rows(self, file_name, fieldnames=FIELDNAMES):
+        """Return the cached rows of a CSV file.
+
+        The returned tuple is shared between requests and must not be
+        modified; use load() to get rows that can be changed and saved.
+        """
+        file_path = self.path(file_name)
+        try:
+            stamp = file_stamp(os.stat(file_path))
+        except FileNotFoundError:
+            self.save(file_name, [], fieldnames)
+            return ()
+
+        # Rows cached without a stamp hold changes not written to the file
+        # yet (see writebehind.WriteBehindStore) and are newer than any parse
+        with self._cache_lock:
+            cached = self._cache.get(file_path)
+            if cached and cached[0] in (stamp, None):
+                return cached[1]
+            parsing = self._parsing.setdefault(file_path, threading.Lock())
+
+        # One parse per file at a time: readers arriving meanwhile (say while
+        # the cache is being prewarmed) wait for its rows instead of parsing again
+        with parsing:
+            with self._cache_lock:
+                cached = self._cache.get(file_path)
+                if cached and cached[0] in (stamp, None):
+                    return cached[1]
+            started = time.perf_counter()
+            with open(file_path, newline="", encoding="utf-8") as f:
+                rows = _read_rows(f, self.record_types.get(file_name))
+            if self.observer:
+                self.observer.read(file_name, len(rows), time.perf_counter() - started)
+            with self._cache_lock:
+                cached = self._cache.get(file_path)
+                if cached and cached[0] is None:
+                    # Changes were staged while the file was parsed
+                    return cached[1]
+                self._cache[file_path] = (stamp, rows)
+        return rows
+
+    def stream(self, file_name, fieldnames=FIELDNAMES):
+        """Yield the rows of a CSV file as dicts straight from disk, bypassing the cache.
+
+        The file is read as it was when streaming started: a rewrite replaces
+        the file under a new inode, and rows appended meanwhile lie past the
+        size seen at open, so they are not read.
+        """
+        try:
+            f = open(self.path(file_name), "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            yield from csv.DictReader(_snapshot_lines(f, size), restval="")
+
+    def load(self, file_name, fieldnames=FIELDNAMES):
+        """Return a private copy of the rows of a CSV file."""
+        return [row.copy() for row in self.rows(file_name, fieldnames)]
+
+    def find(self, file_name, match, fieldnames=FIELDNAMES):
+        """Return a copy of the first row whose columns equal ``match``, or None."""
+        rows, position = self._position(file_name, match, fieldnames)
+        return None if position is None else rows[position].copy()
+
+    def _position(self, file_name, match, fieldnames):
+        """Return the cached rows and the position of the first row matching ``match``.
+
+        Lookups go through a hash index over the matched columns that is built
+        once per cached version of the file.
+        """
+        rows = self.rows(file_name, fieldnames)
+        keys = tuple(match)
+        file_path = self.path(file_name)
+        with self._cache_lock:
+            indexes = self._indexes.get(file_path)
+            if not indexes or indexes[0] is not rows:
+                indexes = (rows, {})
+                self._indexes[file_path] = indexes
+            index = indexes[1].get(keys)
+            if index is None:
+                index = {}
+                for position, row in enumerate(rows):
+                    index.setdefault(tuple(row.get(key) for key in keys), position)
+                indexes[1][keys] = index
+        return rows, index.get(tuple(match[key] for key in keys))
+
+    def update(self, file_name, match, changes, fieldnames=FIELDNAMES):
+        """Change columns of the first row matching ``match``; return the new row."""
+        with self.transaction():
+            rows, position = self._position(file_name, match, fieldnames)
+            if position is None:
+                return None
+            rows = list(rows)
+            row = rows[position] = rows[position].copy()
+            row.update(changes)
+            self.save(file_name, rows, fieldnames)
+            return row.copy()
+
+    def update_many(self, file_name, updates, fieldnames=FIELDNAMES):
+        """Apply several (match, changes) pairs with a single rewrite of the file.
+
+        Returns how many of the updates found a row.
+        """
+        with self.transaction():
+            rows = list(self.rows(file_name, fieldnames))
+            key_sets = {tuple(match) for match, _ in updates}
+            positions = {}
+            for position, row in enumerate(rows):
+                for keys in key_sets:
+                    positions.setdefault((keys, tuple(row.get(key) for key in keys)), position)
+            found = 0
+            for match, changes in updates:
+                position = positions.get((tuple(match), tuple(match.values())))
+                if position is not None:
+                    rows[position] = rows[position].copy()
+                    rows[position].update(changes)
+                    found += 1
+            if found:
+                self.save(file_name, rows, fieldnames)
+        return found
+
+    def remove(self, file_name, match, fieldnames=FIELDNAMES):
+        """Delete the first row matching ``match``; return it, or None."""
+        with self.transaction():
+            rows, position = self._position(file_name, match, fieldnames)
+            if position is None:
+                return None
+            rows = list(rows)
+            row = rows.pop(position)
+            self.save(file_name, rows, fieldnames)
+            return row.copy()
+
+    def save(self, file_name, data, fieldnames):
+        """Rewrite a CSV file and keep the written rows as its cached version.
+
+        Rows taken unchanged from the cached version are kept as they are;
+        all others are normalized into private copies.
+        """
+        file_path = self.path(file_name)
+        normalize = _normalizer(fieldnames, self.record_types.get(file_name))
+        with self.transaction():
+            with self._cache_lock:
+                cached = self._cache.get(file_path)
+            shared = set(map(id, cached[1])) if cached else ()
+            rows = Rows(row if id(row) in shared else normalize(row) for row in data)
+            started = time.perf_counter()
+            with atomic_open(file_path) as f:
+                csv.writer(f).writerow(fieldnames)
+                _write_rows(f, rows, fieldnames)
+            with self._cache_lock:
+                self._cache[file_path] = (f.stamp, rows)
+            if self.observer:
+                self.observer.write(file_name, len(rows), f.stamp[2], time.perf_counter() - started)
+
+    def append(self, file_name, data, fieldnames):
+        """Append rows to the end of a CSV file without rewriting it.
+
+        Files whose header does not match the expected fieldnames (for example
+        files written by an older version) are compacted instead, so rows never
+        end up under the wrong columns.
+        """
+        file_path = self.path(file_name)
+        rows = tuple(map(_normalizer(fieldnames, self.record_types.get(file_name)), data))
+        if not rows:
+            return
+        with self.transaction():
+            try:
+                before = file_stamp(os.stat(file_path))
+            except FileNotFoundError:
+                self.save(file_name, rows, fieldnames)
+                return
+            started = time.perf_counter()
+            appended = _append_to(file_path, rows, fieldnames)
+            if appended is None:
+                self.compact(file_name, fieldnames, extra_rows=rows)
+                return
+            stamp, size = appended
+            if self.observer:
+                self.observer.write(file_name, len(rows), size, time.perf_counter() - started)
+
+            with self._cache_lock:
+                cached = self._cache.get(file_path)
+                if cached and cached[0] == before:
+                    self._cache[file_path] = (stamp, cached[1].extended(rows))
+                else:
+                    self._cache.pop(file_path, None)
+
+    def _plan(self, file_name, changes):
+        """Prepare one file of a batch: (journal entry, new rows, stamp the rows extend)."""
+        fieldnames = changes["fieldnames"]
+        file_path = self.path(file_name)
+        if not changes["changes"]:
+            appended = tuple(map(_normalizer(fieldnames, self.record_types.get(file_name)), changes["appends"]))
+            if not appended:
+                return None
+            try:
+                before = file_stamp(os.stat(file_path))
+                payload = _append_payload(file_path, appended, fieldnames)
+            except FileNotFoundError:
+                payload = None
+            if payload is not None:
+                return {"file": file_name, "size": before[2], "data": payload}, appended, before
+
+        rows = self._changed_rows(file_name, changes)
+        with _temp_file(file_path, BATCH_PREFIX) as f:
+            csv.writer(f).writerow(fieldnames)
+            _write_rows(f, rows, fieldnames)
+        return {"file": file_name, "replace": os.path.basename(f.path)}, rows, None
+
+    def _changed_rows(self, file_name, changes):
+        """The rows of a file after one file's changes of a Batch, as new Rows."""
+        fieldnames = changes["fieldnames"]
+        normalize = _normalizer(fieldnames, self.record_types.get(file_name))
+        rows = list(self.rows(file_name, fieldnames))
+        removed = set()
+        changed = set()
+        for match, update in changes["changes"]:
+            position = self._position(file_name, match, fieldnames)[1]
+            if position is not None and position in removed:
+                position = next((i for i in range(position + 1, len(rows)) if i not in removed
+                                 and all(rows[i].get(key) == value for key, value in match.items())), None)
+            if position is None:
+                continue
+            if update is None:
+                removed.add(position)
+            else:
+                rows[position] = rows[position].copy()
+                rows[position].update(update)
+                changed.add(position)
+        # Only changed rows are normalized; untouched ones stay shared with the cache
+        for position in changed - removed:
+            rows[position] = normalize(rows[position])
+        for position in sorted(removed, reverse=True):
+            del rows[position]
+        rows.extend(map(normalize, changes["appends"]))
+        return Rows(_items=rows)
+
+    def _replay(self, entries):
+        """Do the renames and appends of journal entries; safe to repeat."""
+        for entry in entries:
+            file_path = self.path(entry["file"])
+            if "replace" in entry:
+                tmp_path = self.path(entry["replace"])
+                if os.path.exists(tmp_path):
+                    os.replace(tmp_path, file_path)
+            else:
+                # Cut off a partial earlier attempt, then append again
+                fd = os.open(file_path, os.O_WRONLY)
+                try:
+                    os.ftruncate(fd, entry["size"])
+                    os.lseek(fd, 0, os.SEEK_END)
+                    os.write(fd, entry["data"].encode("utf-8"))
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+        _fsync_dir(self.data_dir)
+
+    def _finish_batch(self):
+        """Complete the batch of a journal left behind by a crashed writer."""
+        with open(self.path(JOURNAL_FILE), encoding="utf-8") as f:
+            entries = json.load(f)
+        self._replay(entries)
+        _unlink(self.path(JOURNAL_FILE))
+        _fsync_dir(self.data_dir)
+        for entry in entries:
+            self.invalidate(entry["file"])
+        logger.warning("Completed an interrupted batch of %s", ", ".join(entry["file"] for entry in entries))
+
+    def apply(self, batch):
+        """Write a Batch with one read and one write per file; all files change or none do.
+
+        Rewritten files are first written in full as temporary files. Then a
+        journal listing the renames and appends is written atomically: the
+        point of commit. The journal is removed once they are done, and one
+        left behind by a crash is replayed by the next transaction. A batch
+        that fails before its journal exists changed nothing; its temporary
+        files are deleted (or dropped later by recover()).
+        """
+        with self.transaction():
+            plans = []
+            started = time.perf_counter()
+            # A single file is replaced or appended to atomically on its own
+            journaled = False
+            try:
+                for file_name, changes in batch.files.items():
+                    plan = self._plan(file_name, changes)
+                    if plan:
+                        plans.append(plan)
+                entries = [entry for entry, _, _ in plans]
+                if len(entries) > 1:
+                    write_text_atomic(self.path(JOURNAL_FILE), json.dumps(entries))
+                    journaled = True
+            except BaseException:
+                for entry, _, _ in plans:
+                    if "replace" in entry:
+                        _unlink(self.path(entry["replace"]))
+                raise
+            if not plans:
+                return
+            try:
+                self._replay(entries)
+            except BaseException:
+                for entry in entries:
+                    self.invalidate(entry["file"])
+                raise
+            if journaled:
+                _unlink(self.path(JOURNAL_FILE))
+                _fsync_dir(self.data_dir)
+            seconds = (time.perf_counter() - started) / len(plans)
+
+            for entry, rows, before in plans:
+                file_path = self.path(entry["file"])
+                stamp = file_stamp(os.stat(file_path))
+                with self._cache_lock:
+                    if before is None:
+                        self._cache[file_path] = (stamp, rows)
+                    else:
+                        cached = self._cache.get(file_path)
+                        if cached and cached[0] == before:
+                            self._cache[file_path] = (stamp, cached[1].extended(rows))
+                        else:
+                            self._cache.pop(file_path, None)
+                if self.observer:
+                    size = stamp[2] if before is None else stamp[2] - before[2]
+                    self.observer.write(entry["file"], len(rows), size, seconds)
+
+    def recover(self):
+        """Finish an interrupted batch and delete files prepared by ones that never committed.
+
+        Returns the names of the deleted files.
+        """
+        with self.transaction():
+            leftovers = [name for name in os.listdir(self.data_dir or ".") if name.startswith(BATCH_PREFIX)]
+            for name in leftovers:
+                _unlink(self.path(name))
+        return leftovers
+
+    def compact(self, file_name, fieldnames, extra_rows=()):
+        """Rewrite a CSV file in canonical form with the given fieldnames.
+
+        Appends leave a file as-is; compaction re-orders the header, drops
+        blank lines and fixes a missing trailing newline.
+        """
+        with self.transaction():
+            self.invalidate(file_name)
+            rows = list(self.rows(file_name, fieldnames))
+            rows.extend(extra_rows)
+            # Rows parsed under another header lack columns; have save() normalize them all
+            self.invalidate(file_name)
+            self.save(file_name, rows, fieldnames)
+
+    def invalidate(self, file_name=None):
+        """Drop one cached file, or the whole cache."""
+        with self._cache_lock:
+            if file_name is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(self.path(file_name), None)
+
+
+class DuplicateSerialError(ValueError):
+    """Raised when a serial is written twice to a table that keeps serials unique."""
+
+
+def _table_name(file_name):
+    name = os.path.splitext(os.path.basename(file_name))[0]
+    if not name.replace("_", "").isalnum():
+        raise ValueError(f"Invalid table name: {name}")
+    return name
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+class SqliteStore:
+    """Stores the same files as CsvStore as tables in one SQLite database.
+
+    Each CSV file becomes a table named after the file (``inventory.csv`` ->
+    ``inventory``) with the same columns. Every table has an index on Serial
+    (unique for the files in ``unique_serials``) and on GROUP_KEY, so serial
+    and group lookups are indexed queries. Writes inside transaction() are
+    committed together, which makes moves between files atomic.
+    ``record_types`` works as for CsvStore.
+    """
+
+    def __init__(self, db_path="store.db", unique_serials=(), record_types=None):
+        self.db_path = db_path
+        self.record_types = record_types or {}
+        self.unique_serials = {_table_name(f) for f in unique_serials}
+        self._local = threading.local()
+        self._cache = {}
+        self._tables = set()
+        self._lock = threading.RLock()
+        self.observer = None
+
+    def _observe_write(self, file_name, rows, started):
+        if self.observer:
+            self.observer.write(file_name, rows, None, time.perf_counter() - started)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS store_versions (name TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+            self._local.conn = conn
+            self._local.depth = 0
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """Commit every write made inside the block together, or none of them."""
+        conn = self._connection()
+        if self._local.depth == 0:
+            conn.execute("BEGIN IMMEDIATE")
+        self._local.depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._local.depth -= 1
+            if self._local.depth == 0:
+                conn.execute("ROLLBACK")
+            raise
+        self._local.depth -= 1
+        if self._local.depth == 0:
+            conn.execute("COMMIT")
+
+    def _table(self, file_name, fieldnames):
+        table = _table_name(file_name)
+        if table in self._tables:
+            return table
+        conn = self._connection()
+        columns = ", ".join(f"{_quote(name)} TEXT NOT NULL DEFAULT ''" for name in fieldnames)
+        unique = "UNIQUE " if table in self.unique_serials else ""
+        group = ", ".join(_quote(name) for name in GROUP_KEY if name in fieldnames)
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {_quote(table)} ({columns})")
+        conn.execute(f"CREATE {unique}INDEX IF NOT EXISTS {_quote('ix_' + table + '_serial')} "
+                     f"ON {_quote(table)} (\"Serial\")")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {_quote('ix_' + table + '_group')} "
+                     f"ON {_quote(table)} ({group})")
+        conn.execute("INSERT OR IGNORE INTO store_versions (name, version) VALUES (?, 0)", (table,))
+        with self._lock:
+            self._tables.add(table)
+        return table
+
+    def _version(self, table):
+        row = self._connection().execute(
+            "SELECT version FROM store_versions WHERE name = ?", (table,)).fetchone()
+        return row[0] if row else 0
+
+    def _bump(self, table):
+        self._connection().execute(
+            "UPDATE store_versions SET version = version + 1 WHERE name = ?", (table,))
+
+    def _insert(self, table, rows, fieldnames):
+        columns = ", ".join(_quote(name) for name in fieldnames)
+        marks = ", ".join("?" for _ in fieldnames)
+        try:
+            self._connection().executemany(
+                f"INSERT INTO {_quote(table)} ({columns}) VALUES ({marks})",
+                [tuple(row[name] for name in fieldnames) for row in rows])
+        except sqlite3.IntegrityError as e:
+            raise DuplicateSerialError(str(e)) from e
+
+    def _records(self, file_name, cursor):
+        record_type = self.record_types.get(file_name)
+        if record_type is None:
+            return [dict(row) for row in cursor]
+        parse = record_type.parser([column[0] for column in cursor.description])
+        return [parse(row) for row in cursor]
+
+    def _where(self, match):
+        clause = " AND ".join(f"{_quote(key)} = ?" for key in match)
+        return clause, tuple(match.values())
+
+    def ensure(self, file_name, fieldnames=FIELDNAMES):
+        self._table(file_name, fieldnames)
+
+    def version(self, file_name, fieldnames=FIELDNAMES):
+        """A token that changes whenever the rows of a table change."""
+        table = self._table(file_name, fieldnames)
+        return "%x-%x" % (os.stat(self.db_path).st_ino, self._version(table))
+
+    def rows(self, file_name, fieldnames=FIELDNAMES):
+        """Return the rows of a table in insertion order (shared, read-only)."""
+        table = self._table(file_name, fieldnames)
+        version = self._version(table)
+        with self._lock:
+            cached = self._cache.get(table)
+            if cached and cached[0] == version:
+                return cached[1]
+        started = time.perf_counter()
+        cursor = self._connection().execute(f"SELECT * FROM {_quote(table)} ORDER BY rowid")
+        rows = Rows(self._records(file_name, cursor))
+        if self.observer:
+            self.observer.read(file_name, len(rows), time.perf_counter() - started)
+        with self._lock:
+            self._cache[table] = (version, rows)
+        return rows
+
+    def stream(self, file_name, fieldnames=FIELDNAMES):
+        """Yield the rows of a table as dicts from one read snapshot, bypassing the cache."""
+        table = self._table(file_name, fieldnames)
+        cursor = self._connection().execute(f"SELECT * FROM {_quote(table)} ORDER BY rowid")
+        try:
+            for row in cursor:
+                yield dict(row)
+        finally:
+            cursor.close()
+
+    def load(self, file_name, fieldnames=FIELDNAMES):
+        return [row.copy() for row in self.rows(file_name, fieldnames)]
+
+    def find(self, file_name, match, fieldnames=FIELDNAMES):
+        table = self._table(file_name, fieldnames)
+        clause, params = self._where(match)
+        cursor = self._connection().execute(
+            f"SELECT * FROM {_quote(table)} WHERE {clause} ORDER BY rowid LIMIT 1", params)
+        rows = self._records(file_name, cursor)
+        return rows[0] if rows else None
+
+    def update(self, file_name, match, changes, fieldnames=FIELDNAMES):
+        with self.transaction():
+            row = self.find(file_name, match, fieldnames)
+            if row is None:
+                return None
+            table = self._table(file_name, fieldnames)
+            started = time.perf_counter()
+            row.update(changes)
+            row = _normalizer(fieldnames, self.record_types.get(file_name))(row)
+            clause, params = self._where(match)
+            assignments = ", ".join(f"{_quote(key)} = ?" for key in changes)
+            self._connection().execute(
+                f"UPDATE {_quote(table)} SET {assignments} WHERE rowid = "
+                f"(SELECT rowid FROM {_quote(table)} WHERE {clause} ORDER BY rowid LIMIT 1)",
+                tuple(row[key] for key in changes) + params)
+            self._bump(table)
+            self._observe_write(file_name, 1, started)
+            return row
+
+    def update_many(self, file_name, updates, fieldnames=FIELDNAMES):
+        with self.transaction():
+            return sum(1 for match, changes in updates
+                       if self.update(file_name, match, changes, fieldnames) is not None)
+
+    def remove(self, file_name, match, fieldnames=FIELDNAMES):
+        with self.transaction():
+            row = self.find(file_name, match, fieldnames)
+            if row is None:
+                return None
+            table = self._table(file_name, fieldnames)
+            started = time.perf_counter()
+            clause, params = self._where(match)
+            self._connection().execute(
+                f"DELETE FROM {_quote(table)} WHERE rowid = "
+                f"(SELECT rowid FROM {_quote(table)} WHERE {clause} ORDER BY rowid LIMIT 1)", params)
+            self._bump(table)
+            self._observe_write(file_name, 1, started)
+            return row
+
+    def save(self, file_name, data, fieldnames):
+        rows = [_normalize(row, fieldnames) for row in data]
+        with self.transaction():
+            started = time.perf_counter()
+            table = self._table(file_name, fieldnames)
+            self._connection().execute(f"DELETE FROM {_quote(table)}")
+            self._insert(table, rows, fieldnames)
+            self._bump(table)
+            self._observe_write(file_name, len(rows), started)
+
+    def append(self, file_name, data, fieldnames):
+        rows = [_normalize(row, fieldnames) for row in data]
+        if not rows:
+            return
+        with self.transaction():
+            started = time.perf_counter()
+            table = self._table(file_name, fieldnames)
+            self._insert(table, rows, fieldnames)
+            self._bump(table)
+            self._observe_write(file_name, len(rows), started)
+
+    def apply(self, batch):
+        """Write a Batch in one SQLite transaction."""
+        with self.transaction():
+            for file_name, changes in batch.files.items():
+                fieldnames = changes["fieldnames"]
+                for match, update in changes["changes"]:
+                    if update is None:
+                        self.remove(file_name, match, fieldnames)
+                    else:
+                        self.update(file_name, match, update, fieldnames)
+                self.append(file_name, changes["appends"], fieldnames)
+
+    def recover(self):
+        """SQLite rolls back unfinished transactions itself."""
+        return []
+
+    def compact(self, file_name, fieldnames, extra_rows=()):
+        """SQLite tables are always canonical; only pending rows are written."""
+        self.append(file_name, extra_rows, fieldnames)
+
+    def invalidate(self, file_name=None):
+        with self._lock:
+            if file_name is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(_table_name(file_name), None)
+
+
+def open_store(backend="csv", data_dir=".", db_path=None, unique_serials=(), record_types=None):
+    """Create the store selected by configuration ("csv" or "sqlite")."""
+    if backend == "csv":
+        return CsvStore(data_dir, record_types)
+    if backend == "sqlite":
+        return SqliteStore(db_path or os.path.join(data_dir, "store.db"), unique_serials, record_types)
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+def import_csv_files(source, target, data_files):
+    """Copy every CSV data file from one store into another in one transaction.
+
+    Rows whose serial already exists in a table with unique serials are
+    skipped. Returns {file_name: (imported, skipped)}.
+    """
+    report = {}
+    with target.transaction():
+        for file_name, fieldnames in data_files.items():
+            rows = source.rows(file_name, fieldnames)
+            target.save(file_name, [], fieldnames)
+            try:
+                target.append(file_name, rows, fieldnames)
+                report[file_name] = (len(rows), 0)
+                continue
+            except DuplicateSerialError:
+                target.save(file_name, [], fieldnames)
+            imported = skipped = 0
+            for row in rows:
+                try:
+                    target.append(file_name, [row], fieldnames)
+                    imported += 1
+                except DuplicateSerialError:
+                    skipped += 1
+            report[file_name] = (imported, skipped)
+    return report
@@ -0,0 +1,76 @@
+import importlib
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+demo = None
+
+
+def setUpModule():
+    # demoV11 opens its shops when it is imported
+    global demo
+    data_dir = tempfile.mkdtemp(prefix="api-test-")
+    with mock.patch.dict(os.environ, {"STORES": "main=" + data_dir, "STORAGE_BACKEND": "csv", "WRITE_BEHIND": "0"}):
+        demo = importlib.import_module("demoV11")
+    demo.app.config["TESTING"] = True
+
+
+class ApiTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.client = demo.create_app(prewarm=False).test_client()
+        cls.client.post("/add", data={"brand": "Apple", "model": "i13", "bought_price": "100", "sell_price": "200",
+                                      "category": "available", "serials": ["A1", "A2"], "quantity": "2"})
+
+    def test_unchanged_list_answers_304(self):
+        response = self.client.get("/api/inventory")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json["items"])
+        etag = response.headers["ETag"]
+
+        response = self.client.get("/api/inventory", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b"")
+        self.assertEqual(response.headers["ETag"], etag)
+        # Another query of the same file is another representation
+        self.assertEqual(self.client.get("/api/inventory?per_page=1", headers={"If-None-Match": etag}).status_code, 200)
+
+    def test_write_changes_the_etag(self):
+        etag = self.client.get("/api/service").headers["ETag"]
+        self.client.post("/add_service", data={"brand": "LG", "serial": "SV1", "model": "g5",
+                                               "customer_name": "Ann", "service_price": "50"})
+        response = self.client.get("/api/service", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+        self.assertEqual([phone["Serial"] for phone in response.json["items"]], ["SV1"])
+
+    def test_sell_status_codes(self):
+        group = self.client.get("/api/sells?search=i13").json["items"][0]["Serial"]
+        cases = [
+            ("NOPE", {"serials": ["A1"]}, 404),
+            (group, {"serials": []}, 400),
+            (group, {}, 400),
+            (group, {"serials": "A1"}, 400),
+            (group, {"serials": ["A1", "A2", "A3"]}, 409),
+        ]
+        for serial, body, status in cases:
+            with self.subTest(serial=serial, body=body):
+                response = self.client.post(f"/api/sell/{serial}", json=body)
+                self.assertEqual(response.status_code, status)
+                self.assertIn("error", response.json)
+
+        response = self.client.post(f"/api/sell/{group}", json={"customer_name": "Bob", "serials": ["A1"]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([phone["Serial"] for phone in response.json["sold"]], ["A1"])
+
+    def test_move_status_codes(self):
+        self.assertEqual(self.client.post("/api/send_to_service", json={"brand": "x"}).status_code, 400)
+        self.assertEqual(self.client.post("/api/finish_service/NOPE").status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
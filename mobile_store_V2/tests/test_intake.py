@@ -0,0 +1,62 @@
+import os
+import sys
+import tempfile
+import unittest
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from intake import import_stock, parse_upload
+from storage import FIELDNAMES, INDIVIDUAL_FIELDNAMES, CsvStore
+
+
+class Writes:
+    def __init__(self):
+        self.files = Counter()
+
+    def read(self, file_name, rows, seconds):
+        pass
+
+    def write(self, file_name, rows, size, seconds):
+        self.files[file_name] += 1
+
+
+def upload(*lines):
+    return parse_upload("\n".join(("Brand,Serial,Model,Sell Price",) + lines), {"Category": "available"})
+
+
+class MixedIntakeTest(unittest.TestCase):
+    def setUp(self):
+        self.store = CsvStore(tempfile.mkdtemp(prefix="intake-test-"))
+        self.store.save("inventory.csv", [
+            {"Brand": "Apple", "Serial": "0", "Model": "I13", "Box": "No", "Charger": "No", "Sell Price": "200",
+             "Category": "available", "Quantity": "2"},
+            {"Brand": "LG", "Serial": "0", "Model": "K1", "Box": "No", "Charger": "No", "Sell Price": "50",
+             "Category": "available", "Quantity": "n/a"},
+        ], FIELDNAMES)
+        self.store.save("phones.csv", [], INDIVIDUAL_FIELDNAMES)
+        self.store.observer = self.writes = Writes()
+
+    def test_existing_and_new_groups_write_each_file_once(self):
+        report = import_stock(self.store, "inventory.csv", "phones.csv",
+                              upload("Apple,A1,i13,200", "Apple,A2,i13,200", "Nokia,N1,n9,80"), set())
+
+        self.assertEqual((report.accepted, report.groups_updated, report.groups_created), (3, 1, 1))
+        self.assertEqual(self.writes.files, Counter({"inventory.csv": 1, "phones.csv": 1}))
+        quantities = {row["Model"]: row["Quantity"] for row in CsvStore(self.store.data_dir).rows("inventory.csv")}
+        self.assertEqual(quantities, {"I13": "4", "K1": "n/a", "N9": "1"})
+        phones = CsvStore(self.store.data_dir).rows("phones.csv", INDIVIDUAL_FIELDNAMES)
+        self.assertEqual([phone["Serial"] for phone in phones], ["A1", "A2", "N1"])
+
+    def test_group_with_an_unreadable_quantity_is_rejected(self):
+        report = import_stock(self.store, "inventory.csv", "phones.csv",
+                              upload("LG,L1,k1,50", "Apple,A1,i13,200"), set())
+
+        self.assertEqual(report.serials, ["A1"])
+        self.assertEqual([(line_no, serial) for line_no, serial, _ in report.rejected], [(2, "L1")])
+        quantities = {row["Model"]: row["Quantity"] for row in self.store.rows("inventory.csv")}
+        self.assertEqual(quantities, {"I13": "3", "K1": "n/a"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from moves import InvalidMove, MoveEngine
+from registry import SerialRegistry
+from storage import BATCH_PREFIX, FIELDNAMES, JOURNAL_FILE, CsvStore, DuplicateSerialError, SqliteStore
+
+FILES = {"inventory": "inventory.csv", "services": "services.csv", "finished": "finished.csv", "sold": "sold.csv"}
+
+
+class MoveTest(unittest.TestCase):
+    def open_store(self):
+        return CsvStore(self.data_dir)
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp(prefix="moves-test-")
+        self.store = self.open_store()
+        self.store.save("inventory.csv", [
+            {"Brand": "Apple", "Serial": "A1", "Model": "I13", "Category": "available", "Quantity": "1"},
+            {"Brand": "LG", "Serial": "0", "Model": "K1", "Category": "available", "Quantity": "3"},
+        ], FIELDNAMES)
+        self.store.save("sold.csv", [], FIELDNAMES)
+        self.registry = SerialRegistry(os.path.join(self.data_dir, "serials.log"))
+        self.registry.record([("A1", "inventory")])
+        self.engine = MoveEngine(self.store, FILES, self.registry)
+
+    def serials(self, file_name):
+        return [row["Serial"] for row in self.open_store().rows(file_name)]
+
+    def test_move_changes_both_files_and_the_registry(self):
+        self.engine.move("inventory", "sold", {"Serial": "A1"}, {"Category": "sold"})
+        self.assertEqual(self.serials("inventory.csv"), ["0"])
+        self.assertEqual(self.serials("sold.csv"), ["A1"])
+        self.assertEqual(self.registry.locate("A1"), "sold")
+
+    def test_units_of_a_group_move_one_by_one(self):
+        self.engine.move("inventory", "sold", {"Serial": "0", "Model": "K1"}, units=[{"Serial": "L1"}, {"Serial": "L2"}])
+        self.assertEqual(self.open_store().find("inventory.csv", {"Serial": "0"})["Quantity"], "1")
+        self.assertEqual(self.serials("sold.csv"), ["L1", "L2"])
+
+    def test_failed_move_changes_nothing(self):
+        files = {name: open(self.store.path(name), "rb").read() for name in ("inventory.csv", "sold.csv")}
+        # The source file is prepared, then writing the target fails
+        with mock.patch("storage._append_payload", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                self.engine.move("inventory", "sold", {"Serial": "A1"}, {"Category": "sold"})
+        for name, data in files.items():
+            with open(self.store.path(name), "rb") as f:
+                self.assertEqual(f.read(), data)
+        self.assertEqual([name for name in os.listdir(self.data_dir) if name.startswith(BATCH_PREFIX)], [])
+        self.assertFalse(os.path.exists(self.store.path(JOURNAL_FILE)))
+        self.assertEqual(self.serials("inventory.csv"), ["A1", "0"])
+        self.assertEqual([row["Serial"] for row in self.store.rows("inventory.csv")], ["A1", "0"])
+        self.assertEqual(self.registry.locate("A1"), "inventory")
+
+    def test_journal_left_by_a_crash_is_replayed(self):
+        # The writer dies after committing its journal, before any file changed
+        with mock.patch.object(CsvStore, "_replay", side_effect=OSError("killed")):
+            with self.assertRaises(OSError):
+                self.engine.move("inventory", "sold", {"Serial": "A1"}, {"Category": "sold"})
+        self.assertTrue(os.path.exists(self.store.path(JOURNAL_FILE)))
+        self.assertEqual(self.serials("sold.csv"), [])
+
+        # The next transaction, in any process, finishes the move
+        with self.assertLogs("mobile_store.storage", "WARNING"):
+            self.open_store().recover()
+        self.assertFalse(os.path.exists(self.store.path(JOURNAL_FILE)))
+        self.assertEqual(self.serials("inventory.csv"), ["0"])
+        self.assertEqual(self.serials("sold.csv"), ["A1"])
+        self.assertEqual([row["Serial"] for row in self.store.rows("sold.csv")], ["A1"])
+
+    def test_moves_outside_the_transitions_are_refused(self):
+        with self.assertRaises(InvalidMove):
+            self.engine.move("sold", "inventory", {"Serial": "A1"})
+        self.assertEqual(self.serials("inventory.csv"), ["A1", "0"])
+
+
+class SqliteMoveTest(unittest.TestCase):
+    def setUp(self):
+        self.store = SqliteStore(os.path.join(tempfile.mkdtemp(prefix="moves-test-"), "store.db"),
+                                 unique_serials=["sold.csv"])
+        self.store.save("inventory.csv", [{"Serial": "A1", "Category": "available", "Quantity": "1"},
+                                          {"Serial": "B2", "Category": "available", "Quantity": "1"}], FIELDNAMES)
+        self.store.save("sold.csv", [{"Serial": "B2", "Category": "sold", "Quantity": "1"}], FIELDNAMES)
+        self.engine = MoveEngine(self.store, FILES)
+
+    def serials(self, file_name):
+        return [row["Serial"] for row in self.store.rows(file_name)]
+
+    def test_move_changes_both_tables(self):
+        self.engine.move("inventory", "sold", {"Serial": "A1"}, {"Category": "sold"})
+        self.assertEqual(self.serials("inventory.csv"), ["B2"])
+        self.assertEqual(self.serials("sold.csv"), ["B2", "A1"])
+
+    def test_failed_move_is_rolled_back(self):
+        versions = {name: self.store.version(name) for name in ("inventory.csv", "sold.csv")}
+        # Removing the row from inventory succeeds; the insert into sold is a duplicate
+        with self.assertRaises(DuplicateSerialError):
+            self.engine.move("inventory", "sold", {"Serial": "B2"}, {"Category": "sold"})
+        self.assertEqual(self.serials("inventory.csv"), ["A1", "B2"])
+        self.assertEqual(self.serials("sold.csv"), ["B2"])
+        self.assertEqual({name: self.store.version(name) for name in versions}, versions)
+        self.assertEqual(self.store.find("inventory.csv", {"Serial": "B2"})["Category"], "available")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from intake import import_stock, parse_upload
+from registry import SOLD, SerialRegistry
+from storage import FIELDNAMES, INDIVIDUAL_FIELDNAMES, CsvStore
+
+
+class SerialRegistryTest(unittest.TestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp(prefix="registry-test-")
+        self.log = os.path.join(self.data_dir, "serials.log")
+        self.registry = SerialRegistry(self.log)
+        self.registry.record([("A1", "phones"), ("S1", "phones"), ("0", "phones")])
+        self.registry.record([("S1", SOLD)])
+
+    def test_locations_follow_the_last_move(self):
+        self.assertEqual(self.registry.locate("A1"), "phones")
+        self.assertEqual(self.registry.locate("S1"), SOLD)
+        self.assertTrue(self.registry.in_shop("A1"))
+        self.assertFalse(self.registry.in_shop("S1"))
+        # The grouped rows' placeholder serial is never registered
+        self.assertNotIn("0", self.registry)
+        self.registry.record([("A1", None)])
+        self.assertNotIn("A1", self.registry)
+
+    def test_other_workers_see_recorded_serials(self):
+        other = SerialRegistry(self.log)
+        self.assertIn("A1", other)
+        self.registry.record([("B2", "services")])
+        self.assertEqual(other.locate("B2"), "services")
+
+    def test_intake_rejects_registered_serials(self):
+        store = CsvStore(self.data_dir)
+        store.save("inventory.csv", [], FIELDNAMES)
+        store.save("phones.csv", [], INDIVIDUAL_FIELDNAMES)
+        records = parse_upload("Brand,Serial,Model,Sell Price\n"
+                               "Apple,A1,i13,200\nApple,S1,i13,200\nApple,N1,i13,200\nApple,N1,i13,200",
+                               {"Category": "available"})
+
+        report = import_stock(store, "inventory.csv", "phones.csv", records, SerialRegistry(self.log))
+
+        self.assertEqual(report.serials, ["N1"])
+        self.assertEqual([(serial, reason) for _, serial, reason in report.rejected], [
+            ("A1", "serial already registered"),
+            ("S1", "serial already registered"),
+            ("N1", "serial repeated in this upload"),
+        ])
+        phones = store.rows("phones.csv", INDIVIDUAL_FIELDNAMES)
+        self.assertEqual([phone["Serial"] for phone in phones], ["N1"])
+
+    def test_rebuild_reports_drift_and_conflicts(self):
+        drift, conflicts = self.registry.rebuild({"phones": ["A1"], "services": ["A1", "B2"], SOLD: ["S1"]})
+        self.assertEqual(drift, {"A1": ("phones", "services"), "B2": (None, "services")})
+        self.assertEqual(conflicts, {"A1": ["phones", "services"]})
+        self.assertEqual(SerialRegistry(self.log).locate("B2"), "services")
+
+
+if __name__ == "__main__":
+    unittest.main()
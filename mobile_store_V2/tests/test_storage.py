@@ -0,0 +1,114 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog import BrandCatalog
+from search import SearchIndex
+from storage import FIELDNAMES, Batch, CsvStore, appended_rows
+
+
+class AppendedRowsTest(unittest.TestCase):
+    def setUp(self):
+        self.store = CsvStore(tempfile.mkdtemp(prefix="storage-test-"))
+        self.store.save("inventory.csv", [{"Brand": "Z", "Model": model, "Serial": model}
+                                          for model in ("AAA", "ZZZ", "CCC")], FIELDNAMES)
+
+    def test_appends_extend_the_generation(self):
+        old = self.store.rows("inventory.csv")
+        self.store.append("inventory.csv", [{"Brand": "Z", "Model": "DDD"}], FIELDNAMES)
+        batch = Batch()
+        batch.append("inventory.csv", [{"Brand": "Z", "Model": "EEE"}])
+        self.store.apply(batch)
+        appended = appended_rows(old, self.store.rows("inventory.csv"))
+        self.assertEqual([row["Model"] for row in appended], ["DDD", "EEE"])
+
+    def test_appends_do_not_copy_the_cached_rows(self):
+        old = self.store.rows("inventory.csv")
+        self.store.append("inventory.csv", [{"Brand": "Z", "Model": "DDD"}], FIELDNAMES)
+        rows = self.store.rows("inventory.csv")
+        self.assertIs(rows._items, old._items)
+        # The earlier version still reads as it was
+        self.assertEqual([row["Model"] for row in old], ["AAA", "ZZZ", "CCC"])
+        self.assertEqual(old[-1]["Model"], "CCC")
+        self.assertEqual([row["Model"] for row in rows[-2:]], ["CCC", "DDD"])
+
+        branch = old.extended([{"Model": "EEE"}])
+        self.assertIsNot(branch._items, rows._items)
+        self.assertEqual([row["Model"] for row in rows], ["AAA", "ZZZ", "CCC", "DDD"])
+        self.assertEqual([row["Model"] for row in branch], ["AAA", "ZZZ", "CCC", "EEE"])
+
+    def test_changes_in_the_middle_are_not_appends(self):
+        old = self.store.rows("inventory.csv")
+        self.store.update("inventory.csv", {"Serial": "ZZZ"}, {"Model": "QQQ"})
+        self.assertIsNone(appended_rows(old, self.store.rows("inventory.csv")))
+
+        old = self.store.rows("inventory.csv")
+        batch = Batch()
+        batch.update("inventory.csv", {"Serial": "ZZZ"}, {"Quantity": "5"})
+        batch.append("inventory.csv", [{"Brand": "Z", "Model": "DDD"}])
+        self.store.apply(batch)
+        self.assertIsNone(appended_rows(old, self.store.rows("inventory.csv")))
+
+    def test_derived_state_follows_an_edit(self):
+        index, catalog = SearchIndex(), BrandCatalog()
+        index.refresh({"inventory": self.store.rows("inventory.csv")})
+        catalog.refresh(self.store.rows("inventory.csv"))
+        self.store.update("inventory.csv", {"Serial": "ZZZ"}, {"Model": "QQQ"})
+        index.refresh({"inventory": self.store.rows("inventory.csv")})
+        catalog.refresh(self.store.rows("inventory.csv"))
+        self.assertEqual([row["Model"] for _, row in index.search("qqq")], ["QQQ"])
+        self.assertEqual(catalog.brands_and_models(), {"Z": ["AAA", "CCC", "QQQ"]})
+
+
+class AtomicSaveTest(unittest.TestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp(prefix="storage-test-")
+        self.store = CsvStore(self.data_dir)
+        self.store.save("inventory.csv", [{"Serial": "A1"}], FIELDNAMES)
+
+    def test_failed_save_keeps_the_old_file(self):
+        with open(self.store.path("inventory.csv"), encoding="utf-8") as f:
+            before = f.read()
+        with mock.patch("storage._write_rows", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                self.store.save("inventory.csv", [{"Serial": "B2"}], FIELDNAMES)
+        with open(self.store.path("inventory.csv"), encoding="utf-8") as f:
+            self.assertEqual(f.read(), before)
+        self.assertEqual(sorted(os.listdir(self.data_dir)), [".store.lock", "inventory.csv"])
+        self.assertEqual([row["Serial"] for row in self.store.rows("inventory.csv")], ["A1"])
+
+
+class AppendTest(unittest.TestCase):
+    def setUp(self):
+        self.store = CsvStore(tempfile.mkdtemp(prefix="storage-test-"))
+        self.store.save("sold.csv", [{"Serial": "S1"}], FIELDNAMES)
+
+    def test_append_writes_only_the_new_rows(self):
+        file_path = self.store.path("sold.csv")
+        with open(file_path, "rb") as f:
+            before = f.read()
+        inode = os.stat(file_path).st_ino
+        self.store.append("sold.csv", [{"Serial": "S2"}], FIELDNAMES)
+        with open(file_path, "rb") as f:
+            after = f.read()
+        self.assertEqual(os.stat(file_path).st_ino, inode)
+        self.assertTrue(after.startswith(before))
+        self.assertEqual([row["Serial"] for row in CsvStore(self.store.data_dir).rows("sold.csv")], ["S1", "S2"])
+
+    def test_append_to_an_old_header_rewrites_the_file(self):
+        file_path = self.store.path("sold.csv")
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write("Serial,Brand\r\nS1,Apple\r\n")
+        self.store.append("sold.csv", [{"Serial": "S2", "Brand": "LG"}], FIELDNAMES)
+        with open(file_path, encoding="utf-8") as f:
+            self.assertEqual(f.readline().strip(), ",".join(FIELDNAMES))
+        rows = CsvStore(self.store.data_dir).rows("sold.csv")
+        self.assertEqual([(row["Serial"], row["Brand"]) for row in rows], [("S1", "Apple"), ("S2", "LG")])
+
+
+if __name__ == "__main__":
+    unittest.main()
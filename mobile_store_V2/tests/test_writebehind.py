@@ -0,0 +1,73 @@
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import FIELDNAMES, CsvStore
+from writebehind import WriteBehindStore
+
+
+class StagedRowsTest(unittest.TestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp(prefix="write-behind-test-")
+        CsvStore(self.data_dir).save("inventory.csv", [{"Serial": "A1", "Quantity": "1"}], FIELDNAMES)
+        self.store = WriteBehindStore(self.data_dir, interval=0)
+        self.addCleanup(self.store.close)
+
+    def test_parse_during_staged_write_keeps_the_staged_rows(self):
+        """A reader past the pending check must not overwrite rows staged meanwhile."""
+        store = self.store
+        self.assertEqual(len(store.rows("inventory.csv")), 1)
+        paused, resume = threading.Event(), threading.Event()
+        csv_rows = CsvStore.rows
+
+        def paused_rows(self, file_name, fieldnames=FIELDNAMES):
+            # Only the reader stops, between the pending check and the parse
+            if threading.current_thread().name == "reader":
+                paused.set()
+                resume.wait(5)
+            return csv_rows(self, file_name, fieldnames)
+
+        read = []
+        with mock.patch.object(CsvStore, "rows", paused_rows):
+            reader = threading.Thread(target=lambda: read.append(store.rows("inventory.csv")), name="reader")
+            reader.start()
+            self.assertTrue(paused.wait(5))
+            store.append("inventory.csv", [{"Serial": "B2", "Quantity": "1"}], FIELDNAMES)
+            resume.set()
+            reader.join(5)
+
+        self.assertEqual([row["Serial"] for row in read[0]], ["A1", "B2"])
+        self.assertEqual([row["Serial"] for row in store.rows("inventory.csv")], ["A1", "B2"])
+        store.flush()
+        rows = CsvStore(self.data_dir).rows("inventory.csv")
+        self.assertEqual([row["Serial"] for row in rows], ["A1", "B2"])
+
+
+class JournalReplayTest(unittest.TestCase):
+    def test_opening_leaves_files_alone_until_recover(self):
+        data_dir = tempfile.mkdtemp(prefix="write-behind-test-")
+        CsvStore(data_dir).save("inventory.csv", [{"Serial": "A1"}], FIELDNAMES)
+        store = WriteBehindStore(data_dir, interval=0)
+        store.append("inventory.csv", [{"Serial": "B2"}], FIELDNAMES)
+        # An unclean shutdown: the change is only in the journal
+        store._pending.clear()
+        before = os.stat(store.path("inventory.csv")).st_mtime_ns
+
+        reopened = WriteBehindStore(data_dir, interval=0)
+        self.addCleanup(reopened.close)
+        self.assertEqual(os.stat(store.path("inventory.csv")).st_mtime_ns, before)
+        self.assertEqual(reopened.replayed, 0)
+
+        reopened.recover()
+        self.assertEqual(reopened.replayed, 1)
+        rows = CsvStore(data_dir).rows("inventory.csv")
+        self.assertEqual([row["Serial"] for row in rows], ["A1", "B2"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,287 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+
+from storage import FIELDNAMES, CsvStore, Rows, _append_to, _normalizer
+
+
+# Changes that are not yet written to their CSV files
+JOURNAL_FILE = ".write_behind.journal"
+
+logger = logging.getLogger("mobile_store.write_behind")
+
+
+class WriteBehindStore(CsvStore):
+    """A CsvStore that answers writes from memory and writes the files in the background.
+
+    Every write changes the cached rows at once and is appended to a journal
+    as one fsynced line, so it is durable before the request returns. A
+    worker thread writes each changed file every ``interval`` seconds,
+    coalescing all changes since the last flush into a single write: an
+    append when rows were only appended, a rewrite otherwise. Each write is
+    marked in the journal, and the journal is emptied once every file is up
+    to date. Changes still in the journal are replayed by recover(), which
+    must run before the store is used, and flush() runs at exit. Opening
+    the store touches no data file.
+
+    Until they are flushed the cached rows are the only current copy, so a
+    data directory in this mode must be served by a single process.
+
+    Callables in ``after_flush`` run after each flush, before the journal
+    is emptied, to write state derived from the files. ``replayed`` is the
+    number of journal entries recover() found, non-zero after an unclean
+    shutdown.
+    """
+
+    def __init__(self, data_dir=".", record_types=None, interval=1.0, journal_file=JOURNAL_FILE):
+        super().__init__(data_dir, record_types)
+        self.interval = interval
+        self.journal_path = self.path(journal_file)
+        # file name -> {"fieldnames", "appended" (rows appended since the
+        # last flush, None once the file needs a rewrite), "seq"}
+        self._pending = {}
+        self._seq = 0
+        # Tells pending versions apart from those of an earlier run
+        self._run_id = os.urandom(4).hex()
+        self._journal_fd = None
+        self._stop = threading.Event()
+        self._worker = None
+        self.after_flush = []
+        self.replayed = 0
+        atexit.register(self.close)
+
+    # --- journal ---
+    def _log(self, entry):
+        line = (json.dumps(entry, separators=(",", ":"), default=str) + "\n").encode("utf-8")
+        if self._journal_fd is None:
+            self._journal_fd = os.open(self.journal_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        os.write(self._journal_fd, line)
+        os.fsync(self._journal_fd)
+
+    def recover(self):
+        """Finish interrupted batches, then re-apply journaled changes that had not reached their files.
+
+        Returns the names of the deleted batch files, like CsvStore.recover().
+        """
+        leftovers = super().recover()
+        self._replay_journal()
+        return leftovers
+
+    def _replay_journal(self):
+        """Re-apply journaled changes that had not reached their files."""
+        try:
+            with open(self.journal_path, "rb") as f:
+                lines = f.read().split(b"\n")
+        except FileNotFoundError:
+            return
+        # The last line is empty, or cut off by a crash before it was acknowledged
+        entries = [json.loads(line) for line in lines[:-1] if line]
+        self.replayed = len(entries)
+        flushed = {}
+        for entry in entries:
+            if "flushed" in entry:
+                flushed[entry["flushed"]] = max(flushed.get(entry["flushed"], 0), entry["seq"])
+        replayed = 0
+        with self.transaction():
+            for entry in entries:
+                if "flushed" in entry:
+                    continue
+                self._seq = max(self._seq, entry["seq"])
+                files = {name: changes for name, changes in entry["files"].items()
+                         if entry["seq"] > flushed.get(name, 0)}
+                if files:
+                    self._stage(files, log=False)
+                    replayed += 1
+            if replayed:
+                logger.warning("Replaying %d journaled changes to %s", replayed, ", ".join(self._pending))
+            self.flush()
+
+    # --- staging writes in memory ---
+    def _stage(self, files, log=True):
+        """Apply {file name: changes} to the cached rows and journal them as one entry.
+
+        ``changes`` is a Batch file entry of fieldnames, changes and appends,
+        or of fieldnames and the complete ``rows`` of a file.
+        """
+        with self.transaction():
+            staged = {}
+            for file_name, changes in files.items():
+                fieldnames = list(changes["fieldnames"])
+                normalize = _normalizer(fieldnames, self.record_types.get(file_name))
+                if "rows" in changes:
+                    rows = Rows(normalize(dict(zip(fieldnames, values)) if isinstance(values, list) else values)
+                                for values in changes["rows"])
+                    entry = {"fieldnames": fieldnames, "rows": [[row[name] for name in fieldnames] for row in rows]}
+                    appended = None
+                else:
+                    appends = tuple(normalize(dict(zip(fieldnames, values)) if isinstance(values, list) else values)
+                                    for values in changes["appends"])
+                    if changes["changes"]:
+                        rows = self._changed_rows(file_name, {"fieldnames": fieldnames, "changes": changes["changes"],
+                                                              "appends": appends})
+                    else:
+                        rows = self.rows(file_name, fieldnames).extended(appends)
+                    entry = {"fieldnames": fieldnames, "changes": [list(change) for change in changes["changes"]],
+                             "appends": [[row[name] for name in fieldnames] for row in appends]}
+                    appended = None if changes["changes"] else len(appends)
+                staged[file_name] = (fieldnames, rows, appended, entry)
+
+            if log:
+                self._seq += 1
+                self._log({"seq": self._seq, "files": {name: item[3] for name, item in staged.items()}})
+            for file_name, (fieldnames, rows, appended, _) in staged.items():
+                # Readers see the pending entry and its rows together
+                with self._cache_lock:
+                    pending = self._pending.get(file_name)
+                    if pending is None:
+                        pending = self._pending[file_name] = {"fieldnames": fieldnames, "appended": 0}
+                    if appended is None or pending["appended"] is None or pending["fieldnames"] != fieldnames:
+                        pending["appended"] = None
+                    else:
+                        pending["appended"] += appended
+                    pending["fieldnames"] = fieldnames
+                    pending["seq"] = self._seq
+                    self._cache[self.path(file_name)] = (None, rows)
+        self._start_worker()
+
+    def rows(self, file_name, fieldnames=FIELDNAMES):
+        """Return the cached rows, including changes not yet written to the file.
+
+        A file that has no pending changes is read by CsvStore.rows(), which
+        never replaces rows staged meanwhile with the older file contents.
+        """
+        with self._cache_lock:
+            if file_name in self._pending:
+                cached = self._cache.get(self.path(file_name))
+                if cached:
+                    return cached[1]
+        return super().rows(file_name, fieldnames)
+
+    def version(self, file_name, fieldnames=FIELDNAMES):
+        pending = self._pending.get(file_name)
+        if pending is not None:
+            return f"pending-{self._run_id}-{pending['seq']}"
+        return super().version(file_name, fieldnames)
+
+    def stream(self, file_name, fieldnames=FIELDNAMES):
+        if file_name not in self._pending:
+            yield from super().stream(file_name, fieldnames)
+            return
+        for row in self.rows(file_name, fieldnames):
+            yield dict(row)
+
+    def save(self, file_name, data, fieldnames):
+        self._stage({file_name: {"fieldnames": fieldnames, "rows": list(data)}})
+
+    def append(self, file_name, data, fieldnames):
+        data = list(data)
+        if data:
+            self._stage({file_name: {"fieldnames": fieldnames, "changes": [], "appends": data}})
+
+    def update(self, file_name, match, changes, fieldnames=FIELDNAMES):
+        with self.transaction():
+            row = self.find(file_name, match, fieldnames)
+            if row is None:
+                return None
+            row.update(changes)
+            self._stage({file_name: {"fieldnames": fieldnames, "changes": [(match, dict(changes))], "appends": []}})
+            return row
+
+    def update_many(self, file_name, updates, fieldnames=FIELDNAMES):
+        with self.transaction():
+            found = [(match, dict(changes)) for match, changes in updates
+                     if self._position(file_name, match, fieldnames)[1] is not None]
+            if found:
+                self._stage({file_name: {"fieldnames": fieldnames, "changes": found, "appends": []}})
+            return len(found)
+
+    def remove(self, file_name, match, fieldnames=FIELDNAMES):
+        with self.transaction():
+            row = self.find(file_name, match, fieldnames)
+            if row is not None:
+                self._stage({file_name: {"fieldnames": fieldnames, "changes": [(match, None)], "appends": []}})
+            return row
+
+    def apply(self, batch):
+        """Stage a Batch as one journal entry, so it is replayed whole or not at all."""
+        files = {file_name: changes for file_name, changes in batch.files.items()
+                 if changes["changes"] or changes["appends"]}
+        if files:
+            self._stage(files)
+
+    def compact(self, file_name, fieldnames, extra_rows=()):
+        """Write pending changes, then rewrite the file in canonical form right away."""
+        with self.transaction():
+            self.flush()
+            self.invalidate(file_name)
+            rows = list(self.rows(file_name, fieldnames))
+            rows.extend(extra_rows)
+            self.invalidate(file_name)
+            CsvStore.save(self, file_name, rows, fieldnames)
+
+    def invalidate(self, file_name=None):
+        """Drop cached files; rows with unwritten changes are kept."""
+        with self._cache_lock:
+            for path in [path for path in self._cache if file_name is None or path == self.path(file_name)]:
+                if os.path.basename(path) not in self._pending:
+                    self._cache.pop(path)
+
+    # --- writing the files ---
+    def flush(self):
+        """Write every file with pending changes now; return how many were written."""
+        written = 0
+        with self.transaction():
+            for file_name in list(self._pending):
+                pending = self._pending[file_name]
+                file_path = self.path(file_name)
+                with self._cache_lock:
+                    rows = self._cache[file_path][1]
+                fieldnames = pending["fieldnames"]
+                started = time.perf_counter()
+                appended = None
+                if pending["appended"] and os.path.exists(file_path):
+                    appended = _append_to(file_path, rows[len(rows) - pending["appended"]:], fieldnames)
+                if appended is None:
+                    CsvStore.save(self, file_name, rows, fieldnames)
+                else:
+                    stamp, size = appended
+                    with self._cache_lock:
+                        self._cache[file_path] = (stamp, rows)
+                    if self.observer:
+                        self.observer.write(file_name, pending["appended"], size, time.perf_counter() - started)
+                self._log({"flushed": file_name, "seq": pending["seq"]})
+                del self._pending[file_name]
+                written += 1
+            for callback in self.after_flush:
+                callback()
+            if self._journal_fd is not None:
+                os.ftruncate(self._journal_fd, 0)
+                os.fsync(self._journal_fd)
+            elif os.path.exists(self.journal_path):
+                os.truncate(self.journal_path, 0)
+        return written
+
+    def _start_worker(self):
+        if self._worker is None and self.interval:
+            self._worker = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if self._pending:
+                try:
+                    self.flush()
+                except Exception:
+                    logger.exception("Background flush failed; changes stay in the journal")
+
+    def close(self):
+        """Stop the worker and write everything that is pending."""
+        self._stop.set()
+        if self._worker is not None:
+            self._worker.join()
+            self._worker = None
+        if self._pending:
+            self.flush()